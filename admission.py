@@ -0,0 +1,89 @@
+import math
+import threading
+import time
+
+
+class Rejected(Exception):
+    # Raised by AdmissionQueue.enter when a request is shed
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    # Bounded admission for the search endpoints. At most max_active
+    # requests run at once and at most max_queue more wait for a slot, each
+    # for up to max_wait seconds. A request is shed straight away when the
+    # queue is full, or when it would have to queue while the recent
+    # latency (an exponentially weighted average) is over max_latency.
+    # Shedding fast keeps the workers free instead of piling requests up
+    # behind a backlog they will time out in anyway.
+    #
+    # max_active=0 admits everything.
+    def __init__(self, max_active=0, max_queue=0, max_wait=1.0, max_latency=None, retry_after=1,
+                 smoothing=0.2, clock=time.monotonic):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_latency = max_latency
+        self.retry_after = retry_after
+        self.smoothing = smoothing
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.latency = 0.0
+        self.admitted = 0
+        self.shed = {}
+    
+    def enter(self):
+        # Blocks until the request may run; returns a token for leave().
+        # Raises Rejected when the request is shed.
+        start = self.clock()
+        if self.max_active <= 0:
+            return start
+        with self.condition:
+            if self.active >= self.max_active or self.waiting:
+                if self.waiting >= self.max_queue:
+                    self.reject("queue_full")
+                if self.max_latency is not None and self.latency > self.max_latency:
+                    self.reject("latency")
+                self.waiting += 1
+                try:
+                    admitted = self.condition.wait_for(lambda: self.active < self.max_active, self.max_wait)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.reject("timeout")
+            self.active += 1
+            self.admitted += 1
+        return start
+    
+    def leave(self, token):
+        if self.max_active <= 0:
+            return
+        elapsed = self.clock() - token
+        with self.condition:
+            self.active -= 1
+            self.latency += self.smoothing * (elapsed - self.latency)
+            self.condition.notify()
+    
+    def reject(self, reason):
+        # Called with the condition held
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        # Suggest coming back once the current backlog has drained
+        backlog = self.latency * (self.waiting + 1) / max(self.max_active, 1)
+        raise Rejected(reason, max(self.retry_after, math.ceil(backlog)))
+    
+    def stats(self):
+        with self.condition:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "max_active": self.max_active,
+                "max_queue": self.max_queue,
+                "latency": self.latency,
+                "admitted": self.admitted,
+                "shed": dict(self.shed)
+            }
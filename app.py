@@ -1,232 +1,199 @@
-from flask import Flask, render_template, request, jsonify
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import re
-import string
 import json
 import os
+import threading
+import time
 
-# Download necessary NLTK data
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('wordnet')
+from admission import AdmissionQueue, Rejected
+from cache import QueryCache
+import metrics
+from knowledge_base import KnowledgeBase
+from shards import ShardedKnowledgeBase, UnknownJurisdiction
+from suggest import Suggester
+import text_processing
 
 app = Flask(__name__)
 
-# Initialize lemmatizer
-lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words('english'))
-
-# Load the knowledge base (structured from the provided document)
-class KnowledgeBase:
-    def __init__(self):
-        self.sections = {
-            "general_procedure": {
-                "title": "General Procedure",
-                "content": """
-                Small Claims Court is a specialized court designed to provide an accessible and simplified process for resolving 
-                minor disputes. Key features include: monetary limit of $5,000 for Ithaca City Court; informal procedures; 
-                optional legal representation; handles various case types including unpaid debts, property damage, and breach of 
-                contract; lower filing fees ($15-$20); hearings before a judge; no jury trials unless requested by defendant.
-                """,
-                "subsections": {
-                    "filing": {
-                        "title": "Filing a Claim",
-                        "content": """
-                        To file a claim, complete an application form with accurate names and addresses of all parties and a 
-                        description of events. Filing fees in Ithaca City Court are $15 for claims up to $1,000 and $20 for claims 
-                        between $1,000-$5,000. Partnerships can only initiate commercial small claims. Corporations, LLCs, and 
-                        associations must file commercial small claims.
-                        """
-                    },
-                    "serving": {
-                        "title": "Serving the Defendant",
-                        "content": """
-                        You must serve the defendant with a copy of the summons and complaint. This can be done through personal 
-                        service (someone over 18 not involved in the case delivers documents), certified mail with return receipt, 
-                        or substitute service (leaving documents with someone at defendant's home/business). The person serving 
-                        must complete an affidavit of service.
-                        """
-                    },
-                    "trial": {
-                        "title": "Day of Trial",
-                        "content": """
-                        Arrive early, bring all relevant documents and evidence, organize materials logically, dress professionally, 
-                        prepare a clear opening statement, ensure witnesses are present, and maintain a respectful demeanor. 
-                        During the trial, you present your case first, followed by the defendant. Both sides can question each 
-                        other and any witnesses. The court typically mails its decision within 30 days.
-                        """
-                    }
-                }
-            },
-            "collections": {
-                "title": "Collections",
-                "content": """
-                If you win a claim, you become the judgment creditor. Judgments in NY are valid for 20 years with 9% annual interest. 
-                First contact the judgment debtor to ensure they're aware of the court's decision. If not paid within 30 days, 
-                you may begin collection efforts such as garnishing wages, seizing assets, placing liens on property, or suspending licenses.
-                """,
-                "subsections": {
-                    "information_subpoena": {
-                        "title": "Information Subpoena",
-                        "content": """
-                        An information subpoena identifies the location of debtor's assets. It can be sent to the debtor or any 
-                        entity with information about their assets. You can obtain one from your local court clerk for $3. 
-                        It must be served by registered/certified mail with return receipt.
-                        """
-                    },
-                    "enforcement_officers": {
-                        "title": "Enforcement Officers",
-                        "content": """
-                        For uncooperative debtors, you may need a sheriff or city marshal to help collect the debt. 
-                        Contact an officer in a county where the debtor has property. Provide information about the debtor's 
-                        assets and ask them to obtain an "execution" to seize property or money. Their fees may be added to 
-                        the judgment amount.
-                        """
-                    }
-                }
-            },
-            "landlord_tenant": {
-                "title": "Landlord/Tenant Law",
-                "content": """
-                In New York, landlord-tenant relationships are governed by Article 7 of the Consolidated Laws. Leases must identify 
-                premises, parties, rent amount, duration, and rights/obligations. Certain lease provisions are illegal, including 
-                exempting landlords from liability or waiving habitability warranty. Rent regulation includes rent control and rent stabilization.
-                """,
-                "subsections": {
-                    "security_deposits": {
-                        "title": "Security Deposits",
-                        "content": """
-                        Landlords can require up to one month's rent as security deposit. Buildings with 6+ units must place deposits 
-                        in interest-bearing accounts. Deposits must be returned with itemized deductions within 14 days of move-out.
-                        If not provided on time, landlord must return entire deposit regardless of damage.
-                        """
-                    },
-                    "evictions": {
-                        "title": "Evictions",
-                        "content": """
-                        Landlords must give 14-day written notice for non-payment before eviction proceedings. Only a sheriff, 
-                        marshal, or constable can execute court-ordered eviction warrants. Tenants can dismiss non-payment cases 
-                        by paying all owed rent until actual eviction. Tenants cannot be evicted for non-payment of fees like late fees.
-                        """
-                    }
-                }
-            },
-            "auto_law": {
-                "title": "Auto Law",
-                "content": """
-                New York's lemon laws protect consumers who purchase/lease cars that don't meet standards. New cars are those purchased/leased 
-                less than 2 years from original delivery with fewer than 18,000 miles. Used car lemon law applies to dealer sales with purchase 
-                price of at least $1,500 and up to 100,000 miles.
-                """,
-                "subsections": {
-                    "car_accidents": {
-                        "title": "Car Accidents",
-                        "content": """
-                        New York is a no-fault insurance state with $50,000 minimum coverage for medical costs and limited lost income. 
-                        You can sue for economic damages beyond no-fault benefits and for non-economic damages only for "serious injury" 
-                        as defined by Insurance Law Section 5102. Cases are based on negligence (duty, breach, causation, damages).
-                        """
-                    },
-                    "repairs": {
-                        "title": "Auto Repairs",
-                        "content": """
-                        Deal only with registered shops (green and white "Registered State of New York Motor Vehicle Repair Shop" sign). 
-                        Request written estimates listing parts, costs, and labor charges. Shops cannot perform work without permission or 
-                        charge more than estimated without approval. You're entitled to all replaced parts if requested in writing before work.
-                        """
-                    }
-                }
-            },
-            "statute_limitations": {
-                "title": "Statute of Limitations",
-                "content": """
-                Different types of cases have different time limits for filing. Key time limits include: contracts (written or oral) - 6 years; 
-                property damage - 3 years; car accidents - 3 years; medical malpractice - 2 years and 6 months; debt collection - 3 years; 
-                fraud - 6 years.
-                """
-            }
-        }
-        
-        # Define citations for different sections
-        self.citations = {
-            "general_procedure": "New York State Unified Court System, Small Claims Court Guide",
-            "collections": "New York State Unified Court System, Collecting Judgments",
-            "landlord_tenant": "New York State Real Property Law",
-            "auto_law": "New York State Attorney General's Office, Consumer Guides",
-            "statute_limitations": "New York CPLR (Civil Practice Law and Rules)"
-        }
-    
-    def preprocess_text(self, text):
-        # Tokenize, remove punctuation, lemmatize, remove stop words
-        tokens = word_tokenize(text.lower())
-        tokens = [lemmatizer.lemmatize(token) for token in tokens if token not in string.punctuation]
-        tokens = [token for token in tokens if token not in stop_words]
-        return tokens
-    
-    def search(self, query):
-        query_tokens = self.preprocess_text(query)
-        results = []
-        
-        # Search in main sections
-        for section_key, section in self.sections.items():
-            section_tokens = self.preprocess_text(section["content"])
-            score = self.calculate_relevance(query_tokens, section_tokens)
-            if score > 0.2:  # Threshold for relevance
-                results.append({
-                    "section": section["title"],
-                    "content": section["content"].strip(),
-                    "score": score,
-                    "citation": self.citations.get(section_key, "New York State Law")
-                })
-            
-            # Search in subsections if they exist
-            if "subsections" in section:
-                for subsec_key, subsec in section["subsections"].items():
-                    subsec_tokens = self.preprocess_text(subsec["content"])
-                    score = self.calculate_relevance(query_tokens, subsec_tokens)
-                    if score > 0.3:  # Higher threshold for subsections
-                        results.append({
-                            "section": f"{section['title']} - {subsec['title']}",
-                            "content": subsec["content"].strip(),
-                            "score": score,
-                            "citation": self.citations.get(section_key, "New York State Law")
-                        })
-        
-        # Sort by relevance score
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:3]  # Return top 3 most relevant results
-    
-    def calculate_relevance(self, query_tokens, section_tokens):
-        # Simple relevance calculation based on token overlap
-        query_set = set(query_tokens)
-        section_set = set(section_tokens)
-        
-        if not query_set or not section_set:
-            return 0
-        
-        intersection = query_set.intersection(section_set)
-        return len(intersection) / len(query_set)
-    
-    def get_section_titles(self):
-        titles = []
-        for section_key, section in self.sections.items():
-            titles.append(section["title"])
-            if "subsections" in section:
-                for subsec_key, subsec in section["subsections"].items():
-                    titles.append(f"{section['title']} - {subsec['title']}")
-        return titles
-
-# Initialize knowledge base
-kb = KnowledgeBase()
+# The knowledge base is built on first use (or by warm_up) so importing the
+# app stays cheap and needs no NLTK data
+kb = None
+kb_lock = threading.Lock()
+shards = None
+
+# Seconds between checks of the data directory for changed files (0 = off)
+RELOAD_INTERVAL = float(os.environ.get('SMALLCLAIMS_RELOAD_INTERVAL', 0))
+# Bearer token for /api/admin/*; the admin endpoints are off when unset
+ADMIN_TOKEN = os.environ.get('SMALLCLAIMS_ADMIN_TOKEN')
+
+# The jurisdiction served when a request names none; the data directory's
+# own files. Every subdirectory of it is another jurisdiction.
+DEFAULT_JURISDICTION = os.environ.get('SMALLCLAIMS_JURISDICTION', 'ny')
+
+def make_shard(data_dir, jurisdiction):
+    # SMALLCLAIMS_SCORING picks overlap, tfidf or bm25;
+    # SMALLCLAIMS_INDEX_FILE serves a prebuilt, shared index for the default
+    # jurisdiction instead
+    # SMALLCLAIMS_SEMANTIC_WEIGHT > 0 blends in dense (LSA) similarity
+    index_file = os.environ.get('SMALLCLAIMS_INDEX_FILE') if jurisdiction == DEFAULT_JURISDICTION else None
+    return KnowledgeBase(
+        data_dir=None if index_file else data_dir,
+        index_file=index_file,
+        scoring=os.environ.get('SMALLCLAIMS_SCORING', 'overlap'),
+        retrieval=os.environ.get('SMALLCLAIMS_RETRIEVAL', 'maxscore'),
+        spelling=int(os.environ.get('SMALLCLAIMS_SPELLING_DISTANCE', 2)),
+        semantic=float(os.environ.get('SMALLCLAIMS_SEMANTIC_WEIGHT', 0)),
+        semantic_dims=int(os.environ.get('SMALLCLAIMS_SEMANTIC_DIMS', 64)),
+        cache=QueryCache(
+            maxsize=int(os.environ.get('SMALLCLAIMS_CACHE_SIZE', 1024)),
+            ttl=float(os.environ['SMALLCLAIMS_CACHE_TTL']) if 'SMALLCLAIMS_CACHE_TTL' in os.environ else None
+        )
+    )
+
+def get_shards():
+    global shards
+    if shards is None:
+        with kb_lock:
+            if shards is None:
+                # SMALLCLAIMS_MAX_SHARDS caps the jurisdictions held in memory
+                # at once (0 = no cap)
+                shards = ShardedKnowledgeBase(
+                    default=DEFAULT_JURISDICTION,
+                    factory=make_shard,
+                    max_loaded=int(os.environ.get('SMALLCLAIMS_MAX_SHARDS', 0)),
+                    max_workers=int(os.environ.get('SMALLCLAIMS_SHARD_WORKERS', 0)) or None,
+                    reload_interval=RELOAD_INTERVAL
+                )
+    return shards
+
+def get_kb():
+    # The default jurisdiction's knowledge base
+    global kb
+    if kb is None:
+        kb = get_shards().shard(DEFAULT_JURISDICTION)
+    return kb
+
+# Results per question: "k" in the request, 3 when not given
+DEFAULT_K = 3
+MAX_K = int(os.environ.get('SMALLCLAIMS_MAX_K', 50))
+
+def parse_k(data):
+    # Returns k, or None when the value is not an allowed integer
+    k = data.get('k', DEFAULT_K)
+    if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= MAX_K:
+        return None
+    return k
+
+def parse_jurisdictions(value):
+    # "jurisdiction" in the request: one name or a list of them. Returns the
+    # names ([] for the default), or None when the value is malformed.
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not value or not all(isinstance(name, str) and name for name in value):
+        return None
+    return [name.strip() for name in value]
+
+def route(data):
+    # (shards, None) or (None, error response) for a request's jurisdictions
+    names = parse_jurisdictions(data.get('jurisdiction'))
+    if names is None:
+        return None, (jsonify({"error": "jurisdiction must be a name or a list of names"}), 400)
+    try:
+        return get_shards().route(names), None
+    except UnknownJurisdiction as e:
+        return None, (jsonify({"error": f"Unknown jurisdiction: {e.args[0]}"}), 400)
+
+# Typeahead over section titles, the vocabulary and questions asked here
+suggester = None
+SUGGEST_MAX = 20
+
+def get_suggester():
+    global suggester
+    if suggester is None:
+        get_kb()
+        with kb_lock:
+            if suggester is None:
+                suggester = Suggester(kb, max_questions=int(os.environ.get('SMALLCLAIMS_SUGGEST_QUESTIONS', 10000)),
+                                      min_count=int(os.environ.get('SMALLCLAIMS_SUGGEST_MIN_COUNT', 10)))
+    return suggester
+
+def warm_up():
+    # Load the NLTK corpora and build the index before serving traffic;
+    # gunicorn.conf.py calls this in each worker
+    text_processing.warm_up()
+    get_kb()
+    get_suggester().refresh()
+
+# Load shedding for the search endpoints; off unless SMALLCLAIMS_MAX_ACTIVE
+# is set. Only matters with threaded workers (gunicorn --threads).
+admission = AdmissionQueue(
+    max_active=int(os.environ.get('SMALLCLAIMS_MAX_ACTIVE', 0)),
+    max_queue=int(os.environ.get('SMALLCLAIMS_MAX_QUEUE', 16)),
+    max_wait=float(os.environ.get('SMALLCLAIMS_QUEUE_WAIT', 1.0)),
+    max_latency=float(os.environ['SMALLCLAIMS_MAX_LATENCY']) if 'SMALLCLAIMS_MAX_LATENCY' in os.environ else None,
+    retry_after=int(os.environ.get('SMALLCLAIMS_RETRY_AFTER', 1))
+)
+ADMITTED_ENDPOINTS = {'ask', 'ask_stream', 'ask_batch'}
 
 @app.route('/')
 def home():
     # Get all section titles for the navigation menu
-    sections = kb.get_section_titles()
-    return render_template('index.html', sections=sections)
+    sections = get_kb().get_section_titles()
+    return render_template('index.html', sections=sections, jurisdictions=get_shards().jurisdictions(),
+                           default_jurisdiction=DEFAULT_JURISDICTION)
+
+# Worker processes used to tokenize large batches
+BATCH_WORKERS = int(os.environ.get('SMALLCLAIMS_BATCH_WORKERS', os.cpu_count() or 1))
+BATCH_MAX_QUESTIONS = int(os.environ.get('SMALLCLAIMS_BATCH_MAX_QUESTIONS', 10000))
+BATCH_CHUNK_SIZE = 256
+batch_executor = None
+batch_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    global batch_executor
+    if BATCH_WORKERS <= 1:
+        return None
+    with batch_executor_lock:
+        if batch_executor is None:
+            # Never fork this process: it runs request threads, the reload
+            # watcher and the shard pool, and a child could inherit a lock
+            # one of them holds (the normalizer's, a metrics histogram's)
+            # and hang. Workers start clean and load NLTK up front instead.
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            batch_executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=context,
+                                                 initializer=text_processing.load)
+    return batch_executor
+
+def correction_list(corrections):
+    return [{"original": original, "corrected": corrected} for original, corrected in corrections.items()]
+
+def build_answer(user_question, results, corrections=None):
+    # corrections ({misspelled: corrected} query terms) are reported when given
+    if not results:
+        answer = {
+            "answer": "I don't have enough information to answer your question. Please try asking something about small claims court procedures, collections, landlord-tenant law, auto law, or statute of limitations.",
+            "results": []
+        }
+    else:
+        # Construct a helpful response
+        text = f"Based on your question about {user_question}, here's what I found:\n\n"
+        if corrections:
+            text += "Searched for " + ", ".join(f"\"{corrected}\" instead of \"{original}\""
+                                                for original, corrected in corrections.items()) + ".\n\n"
+        for result in results:
+            text += f"{result['content']}\n\nSource: {result['citation']}\n\n"
+        answer = {
+            "answer": text,
+            "results": results
+        }
+    if corrections is not None:
+        answer["corrections"] = correction_list(corrections)
+    return answer
 
 @app.route('/api/ask', methods=['POST'])
 def ask():
@@ -235,205 +202,224 @@ def ask():
     if not user_question:
         return jsonify({"error": "No question provided"}), 400
     
-    results = kb.search(user_question)
+    k = parse_k(request.json)
+    if k is None:
+        return jsonify({"error": f"k must be an integer from 1 to {MAX_K}"}), 400
     
-    if not results:
-        return jsonify({
-            "answer": "I don't have enough information to answer your question. Please try asking something about small claims court procedures, collections, landlord-tenant law, auto law, or statute of limitations in New York State.",
-            "results": []
-        })
+    routed, error = route(request.json)
+    if error:
+        return error
     
-    # Construct a helpful response
-    answer = f"Based on your question about {user_question}, here's what I found:\n\n"
+    results, corrections = get_shards().search_corrected(user_question, k, [name for name, _ in routed])
+    if metrics.ENABLED:
+        metrics.result_count.observe(len(results))
+    if results:
+        get_suggester().record(user_question)
+    with metrics.stage("answer"):
+        answer = build_answer(user_question, results, corrections)
+    with metrics.stage("serialize"):
+        return jsonify(answer)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def answer_events(user_question, k, routed):
+    # Server-Sent Events for /api/ask/stream: any spelling corrections, then
+    # each result as soon as it is known, best first, then the citations
+    # they came from. Only a single jurisdiction streams result by result;
+    # several have to be merged first.
+    if len(routed) == 1:
+        name, kb = routed[0]
+        tokens, corrections = kb.analyze_query(user_question)
+        results = (dict(result, jurisdiction=name) for result in kb.stream_tokens(tokens, k))
+    else:
+        results, corrections = get_shards().search_corrected(user_question, k, [name for name, _ in routed])
+    if corrections:
+        yield sse_event("corrections", {"corrections": correction_list(corrections)})
+    citations = []
+    count = 0
     for result in results:
-        answer += f"{result['content']}\n\nSource: {result['citation']}\n\n"
+        yield sse_event("result", dict(result, rank=count))
+        count += 1
+        if result["citation"] not in citations:
+            citations.append(result["citation"])
+    if metrics.ENABLED:
+        metrics.result_count.observe(count)
+    if count:
+        get_suggester().record(user_question)
+    else:
+        yield sse_event("answer", {"answer": build_answer(user_question, [])["answer"]})
+    yield sse_event("citations", {"citations": citations})
+    yield sse_event("done", {"count": count})
+
+@app.route('/api/ask/stream', methods=['POST'])
+def ask_stream():
+    user_question = request.json.get('question', '')
     
-    return jsonify({
-        "answer": answer,
-        "results": results
-    })
-
-# Create templates directory and files
-os.makedirs('templates', exist_ok=True)
-
-# Create index.html
-with open('templates/index.html', 'w') as f:
-    f.write('''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>NY Small Claims Court Helper</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha1/dist/css/bootstrap.min.css" rel="stylesheet">
-    <style>
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            padding-top: 20px;
-        }
-        .chat-container {
-            height: 500px;
-            overflow-y: auto;
-            border: 1px solid #ccc;
-            border-radius: 5px;
-            padding: 10px;
-            margin-bottom: 10px;
-        }
-        .user-message {
-            background-color: #e6f7ff;
-            padding: 10px;
-            border-radius: 5px;
-            margin-bottom: 10px;
-            max-width: 75%;
-            margin-left: auto;
-        }
-        .bot-message {
-            background-color: #f0f0f0;
-            padding: 10px;
-            border-radius: 5px;
-            margin-bottom: 10px;
-            max-width: 75%;
-        }
-        .citation {
-            font-size: 0.8em;
-            color: #666;
-            margin-top: 5px;
-        }
-        .sidebar {
-            background-color: #f8f9fa;
-            padding: 20px;
-            border-radius: 5px;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="row mb-4">
-            <div class="col">
-                <h1 class="text-center">NY Small Claims Court Helper</h1>
-                <p class="text-center">Ask questions about small claims court procedures in New York State</p>
-            </div>
-        </div>
-        
-        <div class="row">
-            <div class="col-md-8">
-                <div class="chat-container" id="chatContainer">
-                    <div class="bot-message">
-                        Welcome to the NY Small Claims Court Helper! How can I assist you today? You can ask me about:
-                        <ul>
-                            <li>General small claims court procedures</li>
-                            <li>Filing a claim</li>
-                            <li>Serving defendants</li>
-                            <li>The trial process</li>
-                            <li>Collecting judgments</li>
-                            <li>And more...</li>
-                        </ul>
-                    </div>
-                </div>
-                <div class="input-group mb-3">
-                    <input type="text" id="userQuestion" class="form-control" placeholder="Ask a question...">
-                    <button class="btn btn-primary" type="button" id="sendButton">Send</button>
-                </div>
-            </div>
-            
-            <div class="col-md-4">
-                <div class="sidebar">
-                    <h5>Topics</h5>
-                    <ul class="list-group">
-                        {% for section in sections %}
-                        <li class="list-group-item" style="cursor: pointer;" onclick="suggestQuestion('{{ section }}')">{{ section }}</li>
-                        {% endfor %}
-                    </ul>
-                    
-                    <h5 class="mt-4">Common Questions</h5>
-                    <ul class="list-group">
-                        <li class="list-group-item" style="cursor: pointer;" onclick="suggestQuestion('How do I file a small claims case?')">How do I file a small claims case?</li>
-                        <li class="list-group-item" style="cursor: pointer;" onclick="suggestQuestion('What is the monetary limit for small claims court?')">What is the monetary limit for small claims court?</li>
-                        <li class="list-group-item" style="cursor: pointer;" onclick="suggestQuestion('How do I collect a judgment?')">How do I collect a judgment?</li>
-                        <li class="list-group-item" style="cursor: pointer;" onclick="suggestQuestion('What should I do on the day of trial?')">What should I do on the day of trial?</li>
-                        <li class="list-group-item" style="cursor: pointer;" onclick="suggestQuestion('How long do I have to file my case?')">How long do I have to file my case?</li>
-                    </ul>
-                </div>
-            </div>
-        </div>
-    </div>
+    if not user_question:
+        return jsonify({"error": "No question provided"}), 400
     
-    <script>
-        document.getElementById('userQuestion').addEventListener('keypress', function(e) {
-            if (e.key === 'Enter') {
-                askQuestion();
-            }
-        });
-        
-        document.getElementById('sendButton').addEventListener('click', askQuestion);
-        
-        function askQuestion() {
-            const userInput = document.getElementById('userQuestion').value.trim();
-            if (!userInput) return;
-            
-            // Add user message to chat
-            addMessage(userInput, 'user');
-            
-            // Clear input field
-            document.getElementById('userQuestion').value = '';
-            
-            // Show loading message
-            const loadingId = addMessage('Searching for information...', 'bot');
-            
-            // Send question to server
-            fetch('/api/ask', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ question: userInput }),
-            })
-            .then(response => response.json())
-            .then(data => {
-                // Remove loading message
-                document.getElementById(loadingId).remove();
-                
-                // Add bot response
-                addMessage(data.answer, 'bot');
-            })
-            .catch(error => {
-                // Remove loading message
-                document.getElementById(loadingId).remove();
-                
-                // Add error message
-                addMessage('Sorry, there was an error processing your question. Please try again.', 'bot');
-                console.error('Error:', error);
-            });
-        }
-        
-        function addMessage(text, sender) {
-            const chatContainer = document.getElementById('chatContainer');
-            const messageDiv = document.createElement('div');
-            const messageId = 'msg-' + Date.now();
-            messageDiv.id = messageId;
-            
-            if (sender === 'user') {
-                messageDiv.className = 'user-message';
-                messageDiv.innerText = text;
-            } else {
-                messageDiv.className = 'bot-message';
-                messageDiv.innerHTML = text.replace(/\\n/g, '<br>');
-            }
-            
-            chatContainer.appendChild(messageDiv);
-            chatContainer.scrollTop = chatContainer.scrollHeight;
-            
-            return messageId;
-        }
-        
-        function suggestQuestion(text) {
-            document.getElementById('userQuestion').value = text;
-            document.getElementById('userQuestion').focus();
-        }
-    </script>
-</body>
-</html>
-    ''')
+    k = parse_k(request.json)
+    if k is None:
+        return jsonify({"error": f"k must be an integer from 1 to {MAX_K}"}), 400
+    
+    routed, error = route(request.json)
+    if error:
+        return error
+    
+    # X-Accel-Buffering stops nginx from holding events back
+    return Response(stream_with_context(answer_events(user_question, k, routed)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def answer_many(questions, k=DEFAULT_K, jurisdictions=None):
+    results, corrections = get_shards().search_many(questions, executor=get_batch_executor(), k=k,
+                                                    jurisdictions=jurisdictions)
+    return [dict(build_answer(question, found, fixed), question=question)
+            for question, found, fixed in zip(questions, results, corrections)]
+
+def answer_ndjson_lines(lines, jurisdictions=None):
+    # Answer newline-delimited JSON questions a chunk at a time so memory
+    # stays bounded however long the input is
+    def answer_chunk(chunk):
+        questions = []
+        for line in chunk:
+            try:
+                item = json.loads(line)
+                question = item.get('question', '') if isinstance(item, dict) else item
+            except ValueError:
+                question = None
+            questions.append(question if isinstance(question, str) and question else None)
+        answers = iter(answer_many([question for question in questions if question is not None],
+                                   jurisdictions=jurisdictions))
+        for question in questions:
+            if question is None:
+                yield json.dumps({"error": "No question provided"}) + "\n"
+            else:
+                yield json.dumps(next(answers)) + "\n"
+    
+    chunk = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        chunk.append(line)
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            yield from answer_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from answer_chunk(chunk)
+
+@app.route('/api/ask/batch', methods=['POST'])
+def ask_batch():
+    # Streaming mode: one question per line in, one answer per line out;
+    # ?jurisdiction=ny,nj picks the jurisdictions for every line
+    if request.mimetype == 'application/x-ndjson':
+        routed, error = route(request.args)
+        if error:
+            return error
+        return Response(stream_with_context(answer_ndjson_lines(request.stream, [name for name, _ in routed])),
+                        mimetype='application/x-ndjson')
+    
+    data = request.json or {}
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not all(isinstance(q, str) and q for q in questions):
+        return jsonify({"error": "questions must be a list of non-empty strings"}), 400
+    k = parse_k(data)
+    if k is None:
+        return jsonify({"error": f"k must be an integer from 1 to {MAX_K}"}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} questions per batch; use application/x-ndjson for larger batches"}), 413
+    routed, error = route(data)
+    if error:
+        return error
+    
+    return jsonify({"results": answer_many(questions, k, [name for name, _ in routed])})
+
+@app.route('/api/jurisdictions', methods=['GET'])
+def jurisdictions():
+    # What can be asked for, and what this worker has in memory
+    shards = get_shards()
+    return jsonify({"jurisdictions": shards.jurisdictions(), "default": shards.default, "loaded": shards.loaded()})
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    # Completions for a partly typed question: ?q=...&n=8
+    n = request.args.get('n', 8, type=int)
+    if not 1 <= n <= SUGGEST_MAX:
+        return jsonify({"error": f"n must be an integer from 1 to {SUGGEST_MAX}"}), 400
+    return jsonify({"suggestions": get_suggester().suggest(request.args.get('q', ''), n)})
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    # Hit/miss counters for monitoring
+    return jsonify(get_kb().cache.stats())
+
+@app.before_request
+def start_timing():
+    # Clients opt in to a Server-Timing breakdown with "X-Timing: 1"
+    if metrics.ENABLED:
+        request.started = time.perf_counter()
+        metrics.begin_request(request.headers.get('X-Timing') == '1')
+
+@app.before_request
+def admit():
+    if request.endpoint not in ADMITTED_ENDPOINTS:
+        return None
+    try:
+        g.admission = admission.enter()
+    except Rejected as e:
+        response = jsonify({"error": "Server busy, please retry", "reason": e.reason})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return None
+
+@app.after_request
+def release_after_stream(response):
+    # A streamed body is generated after the view returns, and teardown
+    # runs before it, so the slot is held until the server closes the body
+    token = g.get('admission')
+    if token is not None and response.is_streamed:
+        g.pop('admission')
+        response.call_on_close(lambda: admission.leave(token))
+    return response
+
+@app.teardown_request
+def release(exc):
+    # Teardown can run more than once, so only the first call releases
+    token = g.pop('admission', None)
+    if token is not None:
+        admission.leave(token)
+
+@app.after_request
+def finish_timing(response):
+    if metrics.ENABLED and hasattr(request, 'started'):
+        metrics.request_seconds.observe(time.perf_counter() - request.started, request.endpoint)
+        timings = metrics.end_request()
+        if timings:
+            response.headers['Server-Timing'] = metrics.server_timing(timings)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text format; each gunicorn worker reports its own numbers
+    body = metrics.expose(kb, text_processing.normalizer, admission, shards)
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload():
+    if not ADMIN_TOKEN or request.headers.get('Authorization') != f'Bearer {ADMIN_TOKEN}':
+        return jsonify({"error": "Forbidden"}), 403
+    
+    # Reindexes only the files that changed, in every loaded jurisdiction;
+    # searches keep using the old index until the new one is swapped in
+    shards = get_shards()
+    get_kb()
+    try:
+        reloaded = shards.reload()
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Reload failed: {e}"}), 400
+    return jsonify(dict(reloaded[shards.default], shards=reloaded))
 
 # For running the app locally
 if __name__ == '__main__':
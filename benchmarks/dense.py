@@ -0,0 +1,97 @@
+# Benchmarks dense retrieval (semantic.py) on synthetic corpora: embedding
+# build time and memory, then recall@k and latency of the IVF index at
+# several probe counts against a brute-force scan of every passage.
+#
+# Usage: python benchmarks/dense.py [--passages 20000 50000] [--probes 1 4 8 16] [--k 10]
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search import percentile
+from synthetic import generate_corpus, generate_queries
+
+
+def timed(call, queries):
+    results, latencies = [], []
+    for query in queries:
+        began = time.perf_counter()
+        results.append(call(query))
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    return results, {"p50_us": percentile(latencies, 0.50) * 1e6, "p99_us": percentile(latencies, 0.99) * 1e6}
+
+
+def run(passages, query_count, probes, k, dims, seed):
+    from cache import QueryCache
+    from knowledge_base import KnowledgeBase
+    from semantic import SemanticIndex
+    
+    sections, citations = generate_corpus(passages, seed=seed)
+    kb = KnowledgeBase(sections=sections, citations=citations, cache=QueryCache(maxsize=0))
+    engine = kb.snapshot.engine
+    
+    began = time.perf_counter()
+    index = SemanticIndex.build(engine, dims=dims, seed=seed)
+    build_seconds = time.perf_counter() - began
+    
+    vectors = [index.embed(engine.query_terms(kb.analyze_query(question)[0])[0])
+               for question in generate_queries(sections, query_count, seed=seed + 1)]
+    vectors = [vector for vector in vectors if vector is not None]
+    
+    exact, exact_latency = timed(lambda vector: index.search_exact(vector, k)[0], vectors)
+    result = {
+        "passages": engine.num_docs,
+        "dims": index.vectors.shape[1],
+        "lists": 0 if index.centroids is None else len(index.centroids),
+        "default_probes": index.probes,
+        "build_seconds": build_seconds,
+        "memory_mb": index.memory() / 2 ** 20,
+        "queries": len(vectors),
+        "brute_force": exact_latency,
+        "ivf": {}
+    }
+    for probe_count in sorted(set(probes) | ({index.probes} if index.probes else set())):
+        found, latency = timed(lambda vector: index.search(vector, k, probes=probe_count)[0], vectors)
+        hits = sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(found, exact))
+        latency["recall"] = hits / max(1, sum(len(b) for b in exact))
+        result["ivf"][probe_count] = latency
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dense retrieval against brute force")
+    parser.add_argument('--passages', type=int, nargs='+', default=[20000, 50000])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--dims', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+    
+    runs = []
+    for passages in args.passages:
+        result = run(passages, args.queries, args.probes, args.k, args.dims, args.seed)
+        runs.append(result)
+        print(f"{result['passages']:>7} passages: {result['dims']} dims, {result['lists']} lists "
+              f"({result['default_probes']} probed by default), built in {result['build_seconds']:.1f} s, {result['memory_mb']:.1f} MiB")
+        stats = result["brute_force"]
+        print(f"{'':>9}brute force      p50 {stats['p50_us']:8.1f} us  p99 {stats['p99_us']:8.1f} us")
+        for probe_count, stats in result["ivf"].items():
+            print(f"{'':>9}ivf {probe_count:>3} probes   p50 {stats['p50_us']:8.1f} us  p99 {stats['p99_us']:8.1f} us  "
+                  f"recall@{args.k} {stats['recall']:.3f}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "k": args.k, "runs": runs}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# Benchmarks the jurisdiction shards (shards.py): writes several synthetic
+# jurisdictions to a temporary data directory, then measures the memory
+# loaded and the search latency when questions touch 1, 2, 4... of them.
+# Both should grow with the shards touched, not with the shards on disk.
+#
+# Usage: python benchmarks/jurisdictions.py [--jurisdictions 8] [--passages 5000] [--touch 1 2 4]
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search import percentile
+from synthetic import generate_corpus, generate_queries
+
+
+def write_jurisdictions(directory, count, passages, seed):
+    # The first jurisdiction is the default and lives in the directory
+    # itself; the others are subdirectories j1, j2...
+    names = []
+    for number in range(count):
+        name = "j0" if number == 0 else f"j{number}"
+        path = directory if number == 0 else os.path.join(directory, name)
+        os.makedirs(path, exist_ok=True)
+        sections, citations = generate_corpus(passages, seed=seed + number)
+        with open(os.path.join(path, "corpus.json"), 'w') as f:
+            json.dump({"sections": [dict(section, key=key, citation=citations[key])
+                                    for key, section in sections.items()]}, f)
+        names.append(name)
+    return names, generate_queries(sections, 1000, seed=seed)
+
+
+def run(directory, names, questions, touched, k):
+    from cache import QueryCache
+    from knowledge_base import KnowledgeBase
+    from shards import ShardedKnowledgeBase
+    
+    shards = ShardedKnowledgeBase(data_dir=directory, default=names[0],
+                                  factory=lambda path, name: KnowledgeBase(data_dir=path, cache=QueryCache(maxsize=0)))
+    jurisdictions = names[:touched]
+    tracemalloc.start()
+    began = time.perf_counter()
+    shards.route(jurisdictions)
+    load_seconds = time.perf_counter() - began
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    
+    latencies = []
+    for question in questions:
+        began = time.perf_counter()
+        shards.search(question, k, jurisdictions)
+        latencies.append(time.perf_counter() - began)
+    latencies.sort()
+    return {
+        "touched": touched,
+        "loaded": len(shards.loaded()),
+        "load_seconds": load_seconds,
+        "memory_mb": memory / 2 ** 20,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark searches across jurisdiction shards")
+    parser.add_argument('--jurisdictions', type=int, default=8)
+    parser.add_argument('--passages', type=int, default=5000, help='passages per jurisdiction')
+    parser.add_argument('--touch', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+    
+    directory = tempfile.mkdtemp(prefix='smallclaims-shards-')
+    try:
+        names, questions = write_jurisdictions(directory, args.jurisdictions, args.passages, args.seed)
+        questions = questions[:args.queries]
+        runs = []
+        for touched in args.touch:
+            result = run(directory, names, questions, min(touched, len(names)), args.k)
+            runs.append(result)
+            print(f"{result['touched']} of {len(names)} shards: loaded in {result['load_seconds']:.1f} s, "
+                  f"{result['memory_mb']:.1f} MiB, p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "jurisdictions": args.jurisdictions,
+                       "passages": args.passages, "k": args.k, "runs": runs}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
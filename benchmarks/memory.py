@@ -0,0 +1,113 @@
+# Compares the memory of N worker processes that each build the knowledge
+# base in memory against N workers that map one shared index file
+# (see index_file.py). Linux only: reads PSS from /proc/self/smaps_rollup,
+# which splits shared pages evenly between the processes mapping them.
+#
+# Usage: python benchmarks/memory.py [--workers 4] [--scale 200] [--output memory.json]
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def pss_kb():
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+    return 0
+
+
+def scaled_corpus(directory, scale):
+    # Copies of the shipped data files, each copy with some terms of its own
+    # so the vocabulary grows with the corpus
+    from knowledge_base import DATA_DIR
+    for copy in range(scale):
+        for name in sorted(os.listdir(DATA_DIR)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(DATA_DIR, name)) as f:
+                section = json.load(f)
+            section["key"] = f"{section.get('key', name[:-5])}_{copy}"
+            section["content"] += f" Reference r{copy}x{len(name)} docket d{copy}."
+            for number, subsec in enumerate(section.get("subsections", {}).values()):
+                subsec["content"] += f" Reference r{copy}s{number} form f{copy}."
+            with open(os.path.join(directory, f"{copy:05d}_{name}"), 'w') as f:
+                json.dump(section, f)
+
+
+def worker(mode, source, barrier, results):
+    from knowledge_base import KnowledgeBase
+    from cache import QueryCache
+    
+    baseline = pss_kb()
+    if mode == "mapped":
+        kb = KnowledgeBase(index_file=source, cache=QueryCache(maxsize=0))
+        # Touch every page, as a long-running worker eventually would
+        kb.snapshot.engine.term_weights.data.sum()
+        for document in kb.snapshot.documents:
+            pass
+    else:
+        kb = KnowledgeBase(data_dir=source, cache=QueryCache(maxsize=0))
+    kb.search("How do I file a small claims case?")
+    # Measure once every worker is loaded so shared pages are split N ways
+    barrier.wait()
+    results.put(pss_kb() - baseline)
+    barrier.wait()
+
+
+def measure(mode, source, workers):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, source, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of N workers, in-memory vs mapped index")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--scale', type=int, default=200, help='copies of the shipped corpus')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+    
+    from index_file import write_index_file
+    from knowledge_base import KnowledgeBase
+    
+    directory = tempfile.mkdtemp(prefix='smallclaims-memory-')
+    try:
+        data_dir = os.path.join(directory, 'data')
+        os.makedirs(data_dir)
+        scaled_corpus(data_dir, args.scale)
+        index_path = os.path.join(directory, 'index.bin')
+        kb = KnowledgeBase(data_dir=data_dir)
+        write_index_file(kb.snapshot, index_path)
+        
+        report = {"workers": args.workers, "scale": args.scale, "documents": len(kb.snapshot.documents),
+                  "index_file_bytes": os.path.getsize(index_path)}
+        for mode, source in (("in_memory", data_dir), ("mapped", index_path)):
+            samples = measure(mode, source, args.workers)
+            report[mode] = {"pss_kb_per_worker": samples, "pss_kb_total": sum(samples)}
+            print(f"{mode:>9}: {sum(samples) / 1024:8.1f} MiB for {args.workers} workers "
+                  f"({sum(samples) / len(samples) / 1024:.1f} MiB each)")
+    finally:
+        shutil.rmtree(directory)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
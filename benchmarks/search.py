@@ -0,0 +1,170 @@
+# Search benchmark: builds a synthetic corpus, replays a query mix through
+# KnowledgeBase.search and through /api/ask on Flask's test client, and
+# reports throughput, p50/p95/p99 latency and peak memory.
+#
+# Usage:
+#   python benchmarks/search.py --passages 10 1000 100000 --queries 2000 --output run.json
+#   python benchmarks/search.py --passages 1000 --baseline run.json --threshold 0.10
+#
+# With --baseline, any latency percentile that grows (or throughput that
+# drops) by more than --threshold is reported and the exit status is 1.
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_corpus, generate_queries
+
+
+def percentile(samples, fraction):
+    # Nearest-rank percentile of an already sorted list
+    return samples[min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))]
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "queries": len(latencies),
+        "throughput_qps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def replay(call, queries, warmup):
+    for query in queries[:warmup]:
+        call(query)
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        began = time.perf_counter()
+        call(query)
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run(passages, query_count, scoring, cache_size, seed, retrieval="maxscore"):
+    import app
+    from cache import QueryCache
+    from knowledge_base import KnowledgeBase
+    from shards import ShardedKnowledgeBase
+    
+    sections, citations = generate_corpus(passages, seed=seed)
+    queries = generate_queries(sections, query_count, seed=seed + 1)
+    
+    began = time.perf_counter()
+    kb = KnowledgeBase(sections=sections, citations=citations, scoring=scoring,
+                       cache=QueryCache(maxsize=cache_size), retrieval=retrieval)
+    build_seconds = time.perf_counter() - began
+    
+    # Serve the synthetic corpus from the app as well: /api/ask searches
+    # the default jurisdiction's shard
+    app.kb = kb
+    app.shards = ShardedKnowledgeBase(default=app.DEFAULT_JURISDICTION, factory=lambda *_: kb)
+    client = app.app.test_client()
+    
+    def ask(query):
+        response = client.post('/api/ask', json={'question': query})
+        assert response.status_code == 200, response.status_code
+        return response
+    
+    # Make sure the HTTP numbers are for the synthetic corpus, not data/
+    citations = [result["citation"] for query in queries[:50] for result in ask(query).json["results"]]
+    assert citations and all(citation.startswith("Synthetic Code Section") for citation in citations), citations[:3]
+    
+    warmup = min(50, len(queries))
+    result = {
+        "passages": len(kb.snapshot.documents),
+        "terms": len(kb.snapshot.engine.vocabulary),
+        "build_seconds": build_seconds,
+        "python_api": replay(kb.search, queries, warmup),
+        "http": replay(ask, queries, warmup),
+        "peak_rss_mb": peak_rss_mb()
+    }
+    kb.cache.clear()
+    return result
+
+
+def compare(baseline, current, threshold):
+    # Returns human-readable regressions between two reports
+    regressions = []
+    previous = {run["passages"]: run for run in baseline["runs"]}
+    for run in current["runs"]:
+        before = previous.get(run["passages"])
+        if before is None:
+            continue
+        for path in ("python_api", "http"):
+            for metric in ("p50_ms", "p95_ms", "p99_ms"):
+                old, new = before[path][metric], run[path][metric]
+                if old and new > old * (1 + threshold):
+                    regressions.append(f"{run['passages']} passages {path} {metric}: {old:.3f} -> {new:.3f}")
+            old, new = before[path]["throughput_qps"], run[path]["throughput_qps"]
+            if old and new < old * (1 - threshold):
+                regressions.append(f"{run['passages']} passages {path} throughput: {old:.0f} -> {new:.0f} qps")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark KnowledgeBase.search and /api/ask")
+    parser.add_argument('--passages', type=int, nargs='+', default=[10, 1000, 10000],
+                        help='corpus sizes to run (10 to 100000 passages)')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--scoring', default='overlap')
+    parser.add_argument('--retrieval', default='maxscore', choices=['maxscore', 'exhaustive'])
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='query cache size; 0 (default) measures uncached search')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parser.add_argument('--baseline', help='earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown that counts as a regression')
+    args = parser.parse_args()
+    
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": sys.version.split()[0],
+        "scoring": args.scoring,
+        "retrieval": args.retrieval,
+        "cache_size": args.cache_size,
+        "queries": args.queries,
+        "seed": args.seed,
+        "runs": []
+    }
+    for passages in args.passages:
+        result = run(passages, args.queries, args.scoring, args.cache_size, args.seed, args.retrieval)
+        report["runs"].append(result)
+        for path in ("python_api", "http"):
+            stats = result[path]
+            print(f"{result['passages']:>7} passages {path:>10}: {stats['throughput_qps']:9.1f} qps  "
+                  f"p50 {stats['p50_ms']:7.3f} ms  p95 {stats['p95_ms']:7.3f} ms  p99 {stats['p99_ms']:7.3f} ms")
+        print(f"{'':>7}          build {result['build_seconds']:.2f} s, peak RSS {result['peak_rss_mb']:.0f} MiB")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
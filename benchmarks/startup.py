@@ -0,0 +1,66 @@
+# Measures cold start: time to import app.py and time from process start to
+# the first /api/ask response, each in a fresh interpreter.
+#
+# Usage: python benchmarks/startup.py [--runs 5] [--target-ms 2000]
+# Exits non-zero when the median import-to-first-response time exceeds the target.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.post('/api/ask', json={'question': 'How do I file a small claims case?'})
+assert response.status_code == 200, response.status_code
+answered = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_response_ms': (answered - start) * 1000}))
+'''
+
+
+def measure(runs, warm_up):
+    samples = []
+    for _ in range(runs):
+        code = CHILD.replace('import app\n', 'import app\napp.warm_up()\n') if warm_up else CHILD
+        output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=2000.0,
+                        help='budget for import-to-first-response (median)')
+    parser.add_argument('--warm-up', action='store_true',
+                        help='call app.warm_up() right after import, as gunicorn.conf.py does')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+    
+    samples = measure(args.runs, args.warm_up)
+    report = {
+        'runs': args.runs,
+        'warm_up': args.warm_up,
+        'target_ms': args.target_ms,
+        'import_ms': statistics.median(s['import_ms'] for s in samples),
+        'first_response_ms': statistics.median(s['first_response_ms'] for s in samples),
+        'samples': samples
+    }
+    print(f"import: {report['import_ms']:.1f} ms, import to first response: "
+          f"{report['first_response_ms']:.1f} ms (median of {args.runs}, target {args.target_ms:.0f} ms)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report['first_response_ms'] <= args.target_ms else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
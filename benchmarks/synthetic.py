@@ -0,0 +1,117 @@
+# Synthetic legal-style corpora shaped like KnowledgeBase.sections, and a
+# query mix to replay against them. Deterministic for a given seed.
+import bisect
+import itertools
+import random
+
+LEGAL_TERMS = """
+claim claimant defendant plaintiff court clerk judge hearing trial judgment creditor debtor
+filing fee summons complaint service affidavit subpoena execution garnishment lien levy
+landlord tenant lease rent deposit eviction warrant notice habitability repair estimate
+contract breach damages negligence insurance accident vehicle warranty dealer lemon
+statute limitation appeal motion adjournment default settlement mediation arbitration
+evidence witness testimony exhibit receipt invoice payment interest collection marshal sheriff
+property asset wage account bank employer income exemption license registration county
+""".split()
+
+FILLER = """
+must may can should within days years after before under against any all each written
+certified personal local state small commercial annual total original itemized required
+""".split()
+
+COMMON_QUESTIONS = [
+    "How do I file a small claims case?",
+    "What is the monetary limit for small claims court?",
+    "How do I collect a judgment?",
+    "What should I do on the day of trial?",
+    "How long do I have to file my case?"
+]
+
+SYLLABLES = ["ab", "cor", "den", "fra", "gul", "hem", "jur", "lex", "mor", "nov",
+             "pla", "quo", "res", "sta", "tor", "ven", "wri", "zan"]
+
+
+def pseudo_word(number):
+    # Distinct pronounceable made-up terms for the long tail of the vocabulary
+    word = ""
+    number += len(SYLLABLES)
+    while number:
+        number, digit = divmod(number, len(SYLLABLES))
+        word += SYLLABLES[digit]
+    return word
+
+
+class ZipfSampler:
+    # Picks items with probability proportional to 1 / rank^exponent
+    def __init__(self, items, exponent=1.0):
+        self.items = items
+        self.cumulative = list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, len(items) + 1)))
+    
+    def __call__(self, rng):
+        position = bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1])
+        return self.items[min(position, len(self.items) - 1)]
+
+
+def sentence(rng, sampler, words):
+    tokens = [sampler(rng) if rng.random() < 0.7 else rng.choice(FILLER) for _ in range(words)]
+    return " ".join(tokens).capitalize() + "."
+
+
+def generate_corpus(passages, seed=0, subsections=4, words_per_passage=45):
+    # Returns (sections, citations) with `passages` documents in total
+    # (sections plus subsections). The vocabulary grows with the corpus,
+    # roughly following Heaps' law.
+    rng = random.Random(seed)
+    vocabulary = rng.sample(LEGAL_TERMS, len(LEGAL_TERMS))
+    vocabulary += [pseudo_word(i) for i in range(int(60 * (passages * words_per_passage) ** 0.5))]
+    sampler = ZipfSampler(vocabulary)
+    sections, citations = {}, {}
+    documents = 0
+    number = 0
+    while documents < passages:
+        key = f"topic_{number}"
+        title = f"{rng.choice(LEGAL_TERMS).title()} {rng.choice(LEGAL_TERMS).title()} {number}"
+        section = {
+            "title": title,
+            "content": " ".join(sentence(rng, sampler, words_per_passage // 3) for _ in range(3))
+        }
+        documents += 1
+        children = {}
+        for child in range(min(subsections, passages - documents)):
+            children[f"part_{child}"] = {
+                "title": f"{rng.choice(LEGAL_TERMS).title()} {child}",
+                "content": " ".join(sentence(rng, sampler, words_per_passage // 3) for _ in range(3))
+            }
+            documents += 1
+        if children:
+            section["subsections"] = children
+        sections[key] = section
+        citations[key] = f"Synthetic Code Section {number}"
+        number += 1
+    return sections, citations
+
+
+def generate_queries(sections, count, seed=1):
+    # A mix of the sidebar questions, questions built from corpus terms,
+    # section titles and off-topic questions. Popular questions repeat the
+    # way real traffic does.
+    rng = random.Random(seed)
+    documents = []
+    for section in sections.values():
+        documents.append(section)
+        documents.extend(section.get("subsections", {}).values())
+    
+    pool = []
+    for _ in range(max(count // 4, 10)):
+        kind = rng.random()
+        if kind < 0.25:
+            pool.append(rng.choice(COMMON_QUESTIONS))
+        elif kind < 0.75:
+            words = [word.strip(".").lower() for word in rng.choice(documents)["content"].split()]
+            pool.append(f"How does {' '.join(rng.sample(words, min(4, len(words))))} work?")
+        elif kind < 0.9:
+            pool.append(f"Tell me about {rng.choice(documents)['title']}")
+        else:
+            pool.append(f"What is the weather like on {rng.choice(['Monday', 'Friday', 'the weekend'])}?")
+    popularity = ZipfSampler(pool)
+    return [popularity(rng) for _ in range(count)]
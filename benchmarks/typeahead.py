@@ -0,0 +1,115 @@
+# Benchmarks /api/suggest's Suggester on synthetic corpora: logs a realistic
+# question mix, then times suggest() for every prefix of a stream of new
+# questions, the way typing produces them, logging each question once it
+# is typed out. Measuring runs for --seconds, long enough for the default
+# rebuild interval to rebuild the phrase index in the background a few
+# times. Memory is what tracemalloc sees allocated for the suggester's
+# indexes and question log.
+#
+# Usage: python benchmarks/typeahead.py [--passages 1000 100000] [--budget-us 200] [--max-mb 64]
+# Exits non-zero when p99 latency or memory goes over its budget.
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search import percentile
+from synthetic import generate_corpus, generate_queries
+
+
+def run(passages, question_count, max_questions, seed, seconds):
+    from cache import QueryCache
+    from knowledge_base import KnowledgeBase
+    from suggest import Suggester
+    
+    sections, citations = generate_corpus(passages, seed=seed)
+    questions = generate_queries(sections, question_count, seed=seed + 1)
+    typed = generate_queries(sections, 5000, seed=seed + 2)
+    kb = KnowledgeBase(sections=sections, citations=citations, cache=QueryCache(maxsize=0))
+    
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    began = time.perf_counter()
+    # min_count=1 suggests every logged question: the largest phrase index
+    suggester = Suggester(kb, max_questions=max_questions, min_count=1)
+    for question in questions:
+        suggester.record(question)
+    suggester.refresh()
+    build_seconds = time.perf_counter() - began
+    memory_mb = (tracemalloc.get_traced_memory()[0] - before) / 2 ** 20
+    tracemalloc.stop()
+    
+    for question in questions[:20]:
+        suggester.suggest(question[:10])
+    rebuilds = suggester.rebuilds
+    latencies = []
+    started = time.perf_counter()
+    count = 0
+    while time.perf_counter() - started < seconds:
+        question = typed[count % len(typed)]
+        for end in range(1, len(question) + 1):
+            began = time.perf_counter()
+            suggester.suggest(question[:end])
+            latencies.append(time.perf_counter() - began)
+        suggester.record(question)
+        count += 1
+    latencies.sort()
+    return {
+        "passages": len(kb.snapshot.documents),
+        "stats": suggester.stats(),
+        "build_seconds": build_seconds,
+        "memory_mb": memory_mb,
+        "lookups": len(latencies),
+        "logged": count,
+        "rebuilds": suggester.rebuilds - rebuilds,
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p95_us": percentile(latencies, 0.95) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "max_us": latencies[-1] * 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark typeahead suggestions")
+    parser.add_argument('--passages', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--questions', type=int, default=20000, help='questions logged before measuring')
+    parser.add_argument('--max-questions', type=int, default=10000, help='bound on the question log')
+    parser.add_argument('--seconds', type=float, default=12, help='how long to type and log questions')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget-us', type=float, default=200, help='p99 latency budget in microseconds')
+    parser.add_argument('--max-mb', type=float, default=64, help='memory budget in MiB')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args()
+    
+    runs = []
+    failed = False
+    for passages in args.passages:
+        result = run(passages, args.questions, args.max_questions, args.seed, args.seconds)
+        runs.append(result)
+        stats = result["stats"]
+        print(f"{result['passages']:>7} passages: {stats['terms']} terms, {stats['phrases']} phrases, "
+              f"{result['memory_mb']:.1f} MiB, built in {result['build_seconds']:.2f} s")
+        print(f"{'':>7}  {result['logged']} questions logged, {result['rebuilds']} background rebuilds")
+        print(f"{'':>7}  {result['lookups']} lookups: p50 {result['p50_us']:.1f} us  "
+              f"p95 {result['p95_us']:.1f} us  p99 {result['p99_us']:.1f} us  max {result['max_us']:.1f} us")
+        if result["p99_us"] > args.budget_us:
+            print(f"OVER BUDGET p99 {result['p99_us']:.1f} us > {args.budget_us:.0f} us")
+            failed = True
+        if result["memory_mb"] > args.max_mb:
+            print(f"OVER BUDGET memory {result['memory_mb']:.1f} MiB > {args.max_mb:.0f} MiB")
+            failed = True
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "runs": runs}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
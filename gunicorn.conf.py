@@ -0,0 +1,8 @@
+# Usage: gunicorn -c gunicorn.conf.py app:app
+
+
+def post_worker_init(worker):
+    # Build the knowledge base before the worker takes requests, so the first
+    # user doesn't pay for loading NLTK data and indexing the corpus
+    from app import warm_up
+    warm_up()
@@ -0,0 +1,395 @@
+# Compiles the knowledge base into a single binary index file that gunicorn
+# workers memory-map read-only, so they all share one copy of the vocabulary,
+# postings and document text in the page cache instead of each building
+# their own dicts.
+#
+# Usage:
+#   python index_file.py build [--data-dir data] [--scoring overlap] [--spelling 2] [--semantic-dims 64]
+#                              [-o index.bin]
+#   python index_file.py verify index.bin [--data-dir data]
+#
+# Layout (little-endian, every block 8-byte aligned):
+#   header   magic, format version, block count, then (offset, length) per block
+#   meta     JSON: scoring mode, sizes, section titles, document metadata
+#   vocab_offsets / vocab_blob     sorted UTF-8 terms, found by binary search
+#   term_ptr / doc_ids / weights   postings: the engine's terms x docs CSR matrix
+#   idf                            per-term idf, used to normalise queries
+#   content_offsets / content_blob stripped document text for responses
+#   delete_hashes                  sorted 64-bit hashes of the SymSpell delete
+#                                  strings (see spelling.py)
+#   delete_ptr / delete_terms      ids of the terms stored under each hash
+#   semantic_*                     passage embeddings (see semantic.py), when
+#                                  built with --semantic-dims; empty otherwise
+#   checksum CRC32 of everything after the header
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import sys
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+from semantic import SemanticIndex
+from spelling import SymSpell
+
+MAGIC = b"SCIDX\0\0\0"
+FORMAT_VERSION = 3
+BLOCKS = ("meta", "vocab_offsets", "vocab_blob", "term_ptr", "doc_ids", "weights",
+          "idf", "content_offsets", "content_blob", "delete_hashes", "delete_ptr", "delete_terms",
+          "semantic_term_vectors", "semantic_vectors", "semantic_doc_ids", "semantic_list_ptr", "semantic_centroids")
+HEADER = struct.Struct(f"<8sII{2 * len(BLOCKS)}QI")
+
+
+class IndexFileError(ValueError):
+    pass
+
+
+def align(size):
+    return (size + 7) & ~7
+
+
+def delete_hash(delete):
+    # Stable across processes, unlike hash(). Two deletes sharing a hash
+    # only add candidates, which are checked with a real edit distance.
+    return int.from_bytes(hashlib.blake2b(delete.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def write_index_file(snapshot, path):
+    # Serialise a published IndexSnapshot
+    engine = snapshot.engine
+    terms = sorted(engine.vocabulary, key=lambda term: term.encode('utf-8'))
+    order = np.array([engine.vocabulary[term] for term in terms], dtype=np.int64)
+    term_weights = engine.term_weights[order].tocsr() if len(order) else engine.term_weights
+    term_weights.sort_indices()
+    index_dtype = np.int32 if max(term_weights.nnz, engine.num_docs) < 2 ** 31 else np.int64
+    
+    encoded_terms = [term.encode('utf-8') for term in terms]
+    encoded_content = [document["content"].encode('utf-8') for document in snapshot.documents]
+    
+    # The spelling dictionary, with terms by their id in this file
+    speller = snapshot.speller
+    term_ids = {term: term_id for term_id, term in enumerate(terms)}
+    by_hash = {}
+    for delete, candidates in speller.deletes.items():
+        by_hash.setdefault(delete_hash(delete), set()).update(term_ids[term] for term in candidates)
+    deletes = sorted((key, sorted(ids)) for key, ids in by_hash.items())
+    
+    semantic = snapshot.semantic
+    empty = np.zeros(0, dtype=np.float32)
+    meta = {
+        "scoring": engine.mode,
+        "version": snapshot.version,
+        "num_docs": engine.num_docs,
+        "num_terms": len(terms),
+        "index_dtype": np.dtype(index_dtype).name,
+        "oov_idf": engine.oov_idf,
+        "spelling": {"max_distance": speller.max_distance, "prefix_length": speller.prefix_length},
+        "semantic": None if semantic is None else {
+            "dims": semantic.vectors.shape[1],
+            "lists": 0 if semantic.centroids is None else len(semantic.centroids)
+        },
+        # Titles only; the text lives in content_blob
+        "sections": {
+            key: {"title": section["title"],
+                  "subsections": {subkey: {"title": subsec["title"]}
+                                  for subkey, subsec in section.get("subsections", {}).items()}}
+            for key, section in snapshot.sections.items()
+        },
+        "citations": snapshot.citations,
+        "documents": [{"section": document["section"], "citation": document["citation"],
+                       "threshold": document["threshold"]} for document in snapshot.documents]
+    }
+    blocks = {
+        "meta": json.dumps(meta).encode('utf-8'),
+        "vocab_offsets": np.cumsum([0] + [len(term) for term in encoded_terms], dtype=np.int64).tobytes(),
+        "vocab_blob": b"".join(encoded_terms),
+        "term_ptr": term_weights.indptr.astype(index_dtype).tobytes(),
+        "doc_ids": term_weights.indices.astype(index_dtype).tobytes(),
+        "weights": term_weights.data.astype(np.float64).tobytes(),
+        "idf": np.asarray(engine.idf, dtype=np.float64)[order].tobytes(),
+        "content_offsets": np.cumsum([0] + [len(text) for text in encoded_content], dtype=np.int64).tobytes(),
+        "content_blob": b"".join(encoded_content),
+        "delete_hashes": np.array([key for key, _ in deletes], dtype=np.uint64).tobytes(),
+        "delete_ptr": np.cumsum([0] + [len(ids) for _, ids in deletes], dtype=np.int64).tobytes(),
+        "delete_terms": np.array([term_id for _, ids in deletes for term_id in ids], dtype=np.int32).tobytes(),
+        # Term vectors follow the file's term order; the rest are by document
+        "semantic_term_vectors": (empty if semantic is None else semantic.term_vectors[order]).tobytes(),
+        "semantic_vectors": (empty if semantic is None else semantic.vectors).tobytes(),
+        "semantic_doc_ids": (empty if semantic is None else semantic.doc_ids.astype(np.int64)).tobytes(),
+        "semantic_list_ptr": (empty if semantic is None else semantic.list_ptr.astype(np.int64)).tobytes(),
+        "semantic_centroids": (empty if semantic is None or semantic.centroids is None
+                               else semantic.centroids.astype(np.float32)).tobytes()
+    }
+    
+    table = []
+    payload = bytearray()
+    offset = align(HEADER.size)
+    for name in BLOCKS:
+        data = blocks[name]
+        table += [offset + len(payload), len(data)]
+        payload += data + b"\0" * (align(len(data)) - len(data))
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(BLOCKS), *table, zlib.crc32(payload))
+    with open(path, 'wb') as f:
+        f.write(header + b"\0" * (align(HEADER.size) - HEADER.size))
+        f.write(payload)
+
+
+class BytesView:
+    # Slicing a memoryview gives another view; this returns bytes, which
+    # compare and decode like the terms they hold
+    def __init__(self, view):
+        self.view = view
+    
+    def __getitem__(self, key):
+        return self.view[key].tobytes()
+
+
+class MappedVocabulary:
+    # term -> term id by binary search over the sorted, mapped term blob
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def term(self, term_id):
+        return self.blob[int(self.offsets[term_id]):int(self.offsets[term_id + 1])].decode('utf-8')
+    
+    def __iter__(self):
+        return (self.term(term_id) for term_id in range(len(self)))
+    
+    def get(self, term, default=None):
+        key = term.encode('utf-8')
+        offsets = self.offsets
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = self.blob[int(offsets[mid]):int(offsets[mid + 1])]
+            if candidate < key:
+                lo = mid + 1
+            elif candidate > key:
+                hi = mid
+            else:
+                return mid
+        return default
+
+
+class MappedSymSpell(SymSpell):
+    # The spelling dictionary stored in the file: deletes are found by
+    # binary search over their sorted hashes, and a term's count is read
+    # off the postings pointer, so nothing is copied into the process.
+    # Read-only, like the rest of the file.
+    def __init__(self, vocabulary, term_ptr, hashes, ptr, term_ids, max_distance=2, prefix_length=7, known=None):
+        super().__init__((), 0, prefix_length, known=known)
+        self.max_distance = max_distance
+        self.vocabulary = vocabulary
+        self.term_ptr = term_ptr
+        self.hashes = hashes
+        self.ptr = ptr
+        self.term_ids = term_ids
+    
+    def __len__(self):
+        return len(self.vocabulary)
+    
+    def knows(self, word):
+        return self.vocabulary.get(word) is not None
+    
+    def candidates(self, delete):
+        key = np.uint64(delete_hash(delete))
+        i = int(np.searchsorted(self.hashes, key))
+        if i == len(self.hashes) or self.hashes[i] != key:
+            return []
+        ids = self.term_ids[self.ptr[i]:self.ptr[i + 1]].astype(np.int64)
+        counts = (self.term_ptr[ids + 1] - self.term_ptr[ids]).tolist()
+        return [(self.vocabulary.term(term_id), count) for term_id, count in zip(ids.tolist(), counts)]
+
+
+class MappedDocuments:
+    # Read-only list of document dicts, with the text decoded on access
+    def __init__(self, metadata, offsets, blob):
+        self.metadata = metadata
+        self.offsets = offsets
+        self.blob = blob
+    
+    def __len__(self):
+        return len(self.metadata)
+    
+    def __getitem__(self, doc_id):
+        document = dict(self.metadata[doc_id])
+        document["content"] = self.blob[int(self.offsets[doc_id]):int(self.offsets[doc_id + 1])].decode('utf-8')
+        return document
+    
+    def __iter__(self):
+        return (self[doc_id] for doc_id in range(len(self)))
+
+
+class MappedIndex:
+    # Opens an index file and exposes its blocks as zero-copy numpy views
+    def __init__(self, path, check=False):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < HEADER.size:
+            raise IndexFileError(f"{path}: file too short")
+        magic, version, count, *table, checksum = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise IndexFileError(f"{path}: not a SmallClaims index file")
+        if version != FORMAT_VERSION or count != len(BLOCKS):
+            raise IndexFileError(f"{path}: format version {version}, expected {FORMAT_VERSION}")
+        self.blocks = {name: (table[2 * i], table[2 * i + 1]) for i, name in enumerate(BLOCKS)}
+        if check:
+            start = align(HEADER.size)
+            if zlib.crc32(self.buffer[start:]) != checksum:
+                raise IndexFileError(f"{path}: checksum mismatch")
+        self.meta = json.loads(self.bytes("meta").decode('utf-8'))
+    
+    def bytes(self, name):
+        offset, length = self.blocks[name]
+        return self.buffer[offset:offset + length]
+    
+    def array(self, name, dtype):
+        offset, length = self.blocks[name]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self.buffer, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+    
+    def blob(self, name):
+        # memoryview slices of the map, so reading a term or document
+        # only touches the pages it lives on
+        offset, length = self.blocks[name]
+        return memoryview(self.buffer)[offset:offset + length]
+
+
+def load_index_file(path, check=False, spelling=2, known=None):
+    # Returns an IndexSnapshot backed by the mapped file. spelling caps the
+    # edit distance of the stored spelling dictionary; known is passed on
+    # to it (see SymSpell).
+    from knowledge_base import IndexSnapshot
+    from scoring import ScoringEngine
+    
+    mapped = MappedIndex(path, check=check)
+    meta = mapped.meta
+    index_dtype = meta["index_dtype"]
+    vocabulary = MappedVocabulary(mapped.array("vocab_offsets", np.int64), BytesView(mapped.blob("vocab_blob")))
+    term_weights = sparse.csr_matrix(
+        (mapped.array("weights", np.float64), mapped.array("doc_ids", index_dtype), mapped.array("term_ptr", index_dtype)),
+        shape=(meta["num_terms"], meta["num_docs"]), copy=False
+    )
+    engine = ScoringEngine.from_arrays(meta["scoring"], meta["num_docs"], vocabulary,
+                                       mapped.array("idf", np.float64), meta["oov_idf"], term_weights)
+    documents = MappedDocuments(meta["documents"], mapped.array("content_offsets", np.int64),
+                                BytesView(mapped.blob("content_blob")))
+    speller = MappedSymSpell(vocabulary, term_weights.indptr, mapped.array("delete_hashes", np.uint64),
+                             mapped.array("delete_ptr", np.int64), mapped.array("delete_terms", np.int32),
+                             max_distance=min(spelling, meta["spelling"]["max_distance"]),
+                             prefix_length=meta["spelling"]["prefix_length"], known=known)
+    semantic = None
+    if meta["semantic"] is not None:
+        dims = meta["semantic"]["dims"]
+        semantic = SemanticIndex(
+            mapped.array("semantic_term_vectors", np.float32).reshape(-1, dims),
+            mapped.array("semantic_vectors", np.float32).reshape(-1, dims),
+            mapped.array("semantic_doc_ids", np.int64), mapped.array("semantic_list_ptr", np.int64),
+            mapped.array("semantic_centroids", np.float32).reshape(-1, dims) if meta["semantic"]["lists"] else None
+        )
+    return IndexSnapshot(meta["version"], meta["sections"], meta["citations"], documents, None, engine,
+                         thresholds=[document["threshold"] for document in meta["documents"]], speller=speller,
+                         semantic=semantic)
+
+
+def sample_queries(snapshot, limit=200):
+    # Section titles plus the opening words of every document
+    queries = [document["section"] for document in snapshot.documents]
+    queries += [" ".join(document["content"].split()[:12]) for document in snapshot.documents]
+    return queries[:limit]
+
+
+def misspellings(snapshot, limit=200):
+    # Vocabulary terms with one letter dropped
+    words = [term for term in snapshot.engine.vocabulary if term.isalpha() and len(term) >= 5]
+    return [word[:len(word) // 2] + word[len(word) // 2 + 1:] for word in words[:limit]]
+
+
+def same_results(expected, actual, tolerance=1e-9):
+    # Scores may differ in the last bit: terms are summed in a different order
+    if len(expected) != len(actual):
+        return False
+    for a, b in zip(expected, actual):
+        if {**a, "score": 0} != {**b, "score": 0} or abs(a["score"] - b["score"]) > tolerance:
+            return False
+    return True
+
+
+def verify(path, data_dir=None):
+    # Checks the file's structure and, given the source data, that it
+    # answers the same as an index built in memory. Returns a list of problems.
+    from knowledge_base import KnowledgeBase
+    from cache import QueryCache
+    
+    problems = []
+    try:
+        snapshot = load_index_file(path, check=True)
+    except IndexFileError as e:
+        return [str(e)]
+    engine = snapshot.engine
+    if engine.term_weights.indptr[-1] != engine.term_weights.nnz:
+        problems.append("postings pointer does not match postings length")
+    if len(snapshot.documents) != engine.num_docs:
+        problems.append("document count does not match postings")
+    if data_dir is None:
+        return problems
+    
+    # Stored passage vectors are checked by searching with them. Query
+    # vectors are float32 sums, so those scores only agree to about 1e-7.
+    weight, dims = (0.0, 64) if snapshot.semantic is None else (0.5, snapshot.semantic.vectors.shape[1])
+    tolerance = 1e-9 if snapshot.semantic is None else 1e-6
+    fresh = KnowledgeBase(data_dir=data_dir, scoring=engine.mode, cache=QueryCache(maxsize=0),
+                          semantic=weight, semantic_dims=dims)
+    mapped = KnowledgeBase(index_file=path, cache=QueryCache(maxsize=0), semantic=weight)
+    for query in sample_queries(fresh.snapshot):
+        if not same_results(fresh.search(query), mapped.search(query), tolerance):
+            problems.append(f"results differ for {query!r}")
+    if snapshot.speller.max_distance == fresh.speller.max_distance:
+        for word in misspellings(fresh.snapshot):
+            if fresh.speller.closest(word) != mapped.speller.closest(word):
+                problems.append(f"spelling corrections differ for {word!r}")
+    return problems
+
+
+def main(argv=None):
+    from knowledge_base import DATA_DIR, KnowledgeBase
+    
+    parser = argparse.ArgumentParser(description="Build or verify a SmallClaims index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="compile the knowledge base into an index file")
+    build_parser.add_argument("--data-dir", default=DATA_DIR)
+    build_parser.add_argument("--scoring", default="overlap")
+    build_parser.add_argument("--spelling", type=int, default=2, help="largest edit distance corrected (0 = off)")
+    build_parser.add_argument("--semantic-dims", type=int, default=0,
+                              help="also store passage embeddings of this size (0 = none)")
+    build_parser.add_argument("-o", "--output", default="index.bin")
+    verify_parser = commands.add_parser("verify", help="check an index file")
+    verify_parser.add_argument("path")
+    verify_parser.add_argument("--data-dir", help="also compare search results against this data directory")
+    args = parser.parse_args(argv)
+    
+    if args.command == "build":
+        kb = KnowledgeBase(data_dir=args.data_dir, scoring=args.scoring, spelling=args.spelling)
+        if args.semantic_dims > 0:
+            kb.snapshot.semantic = SemanticIndex.build(kb.snapshot.engine, dims=args.semantic_dims)
+        write_index_file(kb.snapshot, args.output)
+        print(f"Wrote {args.output}: {len(kb.snapshot.documents)} documents, "
+              f"{len(kb.snapshot.engine.vocabulary)} terms ({args.scoring})")
+        return 0
+    
+    problems = verify(args.path, args.data_dir)
+    for problem in problems:
+        print(problem)
+    print("OK" if not problems else f"{len(problems)} problem(s)")
+    return 0 if not problems else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,501 @@
+from collections import Counter
+import json
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+
+from cache import QueryCache, SingleFlight
+import metrics
+from scoring import ScoringEngine
+from semantic import SemanticIndex
+from spelling import SymSpell
+from text_processing import is_word, preprocess_text
+
+try:
+    import yaml
+except ImportError:  # YAML sources are optional
+    yaml = None
+
+# Directory the corpus is loaded from by default
+DATA_DIR = os.environ.get('SMALLCLAIMS_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+DATA_EXTENSIONS = ('.json', '.yaml', '.yml', '.md')
+
+# Nearest passages by embedding considered for each query when dense
+# retrieval is on, on top of the lexical matches
+SEMANTIC_CANDIDATES = 50
+
+
+def slugify(title):
+    return re.sub(r'[^a-z0-9]+', '_', title.lower()).strip('_')
+
+
+def parse_markdown(text, default_key):
+    # One section per file:
+    #
+    #   ---
+    #   key: collections
+    #   citation: New York State Unified Court System, Collecting Judgments
+    #   ---
+    #   # Collections
+    #   Section text...
+    #   ## Information Subpoena
+    #   Subsection text...
+    lines = text.splitlines()
+    meta = {}
+    if lines and lines[0].strip() == '---':
+        end = lines.index('---', 1)
+        for line in lines[1:end]:
+            name, _, value = line.partition(':')
+            meta[name.strip()] = value.strip()
+        lines = lines[end + 1:]
+    
+    section = {"key": meta.get("key", default_key), "citation": meta.get("citation"), "title": "", "content": ""}
+    subsections = {}
+    current = section
+    body = []
+    for line in lines + ['## ']:
+        if line.startswith('#'):
+            current["content"] = " ".join(" ".join(body).split())
+            body = []
+            level = len(line) - len(line.lstrip('#'))
+            title = line.lstrip('#').strip()
+            if level == 1:
+                current = section
+                section["title"] = title
+            elif title:
+                current = {"title": title, "content": ""}
+                subsections[slugify(title)] = current
+        else:
+            body.append(line)
+    if subsections:
+        section["subsections"] = subsections
+    return [section]
+
+
+def load_file(path):
+    # Returns the list of sections stored in a JSON, YAML or Markdown file.
+    # JSON/YAML files hold one section object or {"sections": [...]}.
+    default_key = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if path.endswith('.md'):
+        return parse_markdown(text, default_key)
+    if path.endswith('.json'):
+        data = json.loads(text)
+    elif yaml is None:
+        raise ValueError(f"{path}: PyYAML is required to load YAML files")
+    else:
+        data = yaml.safe_load(text)
+    sections = data.get("sections", [data]) if isinstance(data, dict) else data
+    for section in sections:
+        section.setdefault("key", default_key)
+    return sections
+
+
+class IndexSnapshot:
+    # Everything a search reads, built in full before being published with a
+    # single attribute assignment, so requests never see a half-built index
+    def __init__(self, version, sections, citations, documents, index, engine, thresholds=None, speller=None,
+                 semantic=None):
+        self.version = version
+        self.sections = sections
+        self.citations = citations
+        self.documents = documents
+        self.index = index
+        self.engine = engine
+        # Per-document relevance thresholds, as an array for vectorised checks
+        if thresholds is None:
+            thresholds = [document["threshold"] for document in documents]
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        # Corrects query terms missing from the vocabulary. A KnowledgeBase
+        # shares one speller between its snapshots and updates it in place.
+        self.speller = speller if speller is not None else SymSpell(())
+        # Passage embeddings (a SemanticIndex) when dense retrieval is on
+        self.semantic = semantic
+
+
+# Load the knowledge base (structured from the provided document)
+class KnowledgeBase:
+    # Sections come from data_dir (one file per source), from a prebuilt
+    # index_file (see index_file.py; read-only, reload() does nothing) or,
+    # for tests and benchmarks, straight from a sections/citations dict
+    #
+    # retrieval="maxscore" answers single questions with ScoringEngine.top_k;
+    # "exhaustive" scores every matching document. Both return the same results.
+    #
+    # spelling is the largest edit distance at which a query term missing
+    # from the vocabulary is corrected to a known one (0 turns it off)
+    #
+    # semantic is the weight of dense (LSA) similarity in the final score,
+    # from 0 (off, the default) to 1; see semantic.py and fuse()
+    def __init__(self, data_dir=None, sections=None, citations=None, scoring="overlap", cache=None,
+                 index_file=None, retrieval="maxscore", spelling=2, semantic=0.0, semantic_dims=64):
+        if retrieval not in ("maxscore", "exhaustive"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval}")
+        self.scoring = scoring
+        self.retrieval = retrieval
+        self.spelling = spelling
+        self.semantic = semantic
+        self.semantic_dims = semantic_dims
+        # Results cache keyed on (index version, normalized query terms)
+        self.cache = cache if cache is not None else QueryCache()
+        # Concurrent searches for the same key share one computation
+        self.flights = SingleFlight()
+        self.data_dir = data_dir if data_dir is not None or sections is not None or index_file else DATA_DIR
+        self.version = 0
+        self.snapshot = None
+        # source name -> parsed sections and tokenized documents
+        self.sources = {}
+        self.reload_lock = threading.Lock()
+        # Spelling dictionary, brought up to date by every publish()
+        self.speller = SymSpell((), max_distance=spelling, known=is_word)
+        
+        if index_file:
+            from index_file import load_index_file
+            # The spelling dictionary is stored in the file and shared too
+            snapshot = load_index_file(index_file, spelling=spelling, known=is_word)
+            self.speller = snapshot.speller
+            # Passage vectors stored in the file are shared the same way.
+            # Without them (see index_file.py --semantic-dims) every worker
+            # runs its own SVD and k-means at startup.
+            if self.semantic <= 0:
+                snapshot.semantic = None
+            elif snapshot.semantic is None:
+                snapshot.semantic = self.embed(snapshot.engine)
+            self.snapshot = snapshot
+            self.version = self.snapshot.version
+            self.scoring = self.snapshot.engine.mode
+        elif sections is not None:
+            self.sources["<memory>"] = self.analyze(sections, citations or {})
+            self.publish()
+        else:
+            self.reload()
+    
+    @property
+    def sections(self):
+        return self.snapshot.sections
+    
+    @property
+    def citations(self):
+        return self.snapshot.citations
+    
+    @property
+    def documents(self):
+        return self.snapshot.documents
+    
+    def preprocess_text(self, text):
+        return preprocess_text(text)
+    
+    def analyze(self, sections, citations, mtime=None):
+        # Flatten sections and subsections into documents, in the same order
+        # the brute-force search visits them, so ties keep their old ranking,
+        # and tokenize each one
+        documents = []
+        for section_key, section in sections.items():
+            citation = citations.get(section_key, "New York State Law")
+            documents.append({
+                "section": section["title"],
+                "content": section["content"].strip(),
+                "citation": citation,
+                "threshold": 0.2  # Threshold for relevance
+            })
+            if "subsections" in section:
+                for subsec_key, subsec in section["subsections"].items():
+                    documents.append({
+                        "section": f"{section['title']} - {subsec['title']}",
+                        "content": subsec["content"].strip(),
+                        "citation": citation,
+                        "threshold": 0.3  # Higher threshold for subsections
+                    })
+        terms = [Counter(preprocess_text(document["content"], pin=True)) for document in documents]
+        return {"mtime": mtime, "sections": sections, "citations": citations,
+                "documents": documents, "terms": terms}
+    
+    def analyze_file(self, path, mtime):
+        sections, citations = {}, {}
+        for section in load_file(path):
+            key = section["key"]
+            sections[key] = {name: value for name, value in section.items() if name not in ("key", "citation")}
+            if section.get("citation"):
+                citations[key] = section["citation"]
+        return self.analyze(sections, citations, mtime)
+    
+    def reload(self):
+        # Re-read data_dir, tokenizing only files that were added or changed
+        # since the last load. Returns the names of the changed sources.
+        if self.data_dir is None:
+            return []
+        with self.reload_lock:
+            seen = {}
+            for name in sorted(os.listdir(self.data_dir)):
+                path = os.path.join(self.data_dir, name)
+                if name.endswith(DATA_EXTENSIONS) and os.path.isfile(path):
+                    stat = os.stat(path)
+                    seen[name] = (stat.st_mtime_ns, stat.st_size)
+            
+            changed = [name for name in self.sources if name not in seen]
+            for name in changed:
+                del self.sources[name]
+            for name, mtime in seen.items():
+                source = self.sources.get(name)
+                if source is None or source["mtime"] != mtime:
+                    self.sources[name] = self.analyze_file(os.path.join(self.data_dir, name), mtime)
+                    changed.append(name)
+            
+            if changed or self.snapshot is None:
+                self.publish()
+            return changed
+    
+    def publish(self):
+        # Assemble a new snapshot from the per-source term counts (no
+        # re-tokenizing) and swap it in
+        sections, citations, documents = {}, {}, []
+        # Inverted index: term -> {doc_id: term frequency}
+        index = {}
+        for name in sorted(self.sources):
+            source = self.sources[name]
+            sections.update(source["sections"])
+            citations.update(source["citations"])
+            for document, terms in zip(source["documents"], source["terms"]):
+                doc_id = len(documents)
+                documents.append(document)
+                for term, tf in terms.items():
+                    index.setdefault(term, {})[doc_id] = tf
+        
+        # Sparse document-term matrix used to score queries
+        engine = ScoringEngine(index, len(documents), mode=self.scoring)
+        # Only the terms that came or went are added to or dropped from the
+        # spelling dictionary
+        self.speller.update(engine.document_counts())
+        
+        # A new version invalidates every cached result
+        self.version += 1
+        self.snapshot = IndexSnapshot(self.version, sections, citations, documents, index, engine, speller=self.speller,
+                                      semantic=self.embed(engine))
+        self.cache.clear()
+    
+    def correct(self, tokens, snapshot=None):
+        # Replaces misspelled terms (missing from both the vocabulary and
+        # WordNet) with the closest known term. Returns the tokens and
+        # {misspelled: corrected}.
+        if snapshot is None:
+            snapshot = self.snapshot
+        vocabulary = snapshot.engine.vocabulary
+        corrected, corrections = [], {}
+        with metrics.stage("correct"):
+            for token in tokens:
+                if vocabulary.get(token) is None:
+                    replacement = snapshot.speller.correct(token)
+                    if replacement is not None:
+                        corrections[token] = replacement
+                        token = replacement
+                corrected.append(token)
+        return corrected, corrections
+    
+    def analyze_query(self, query):
+        return self.correct(self.preprocess_text(query))
+    
+    def embed(self, engine):
+        # Passage embeddings are computed here, once per index, never per query
+        if self.semantic <= 0:
+            return None
+        return SemanticIndex.build(engine, dims=self.semantic_dims)
+    
+    def search(self, query, k=3):
+        return self.search_batch([query], k)[0]
+    
+    def search_corrected(self, query, k=3):
+        # search() plus the spelling corrections it applied
+        tokens, corrections = self.analyze_query(query)
+        return self.search_tokens([tokens], k)[0], corrections
+    
+    def search_batch(self, queries, k=3):
+        return self.search_tokens([self.analyze_query(query)[0] for query in queries], k)
+    
+    def search_stream(self, query, k=3):
+        return self.stream_tokens(self.analyze_query(query)[0], k)
+    
+    def stream_tokens(self, tokens, k=3):
+        # Yields what search_tokens([tokens], k) returns, one result at a
+        # time, best first
+        yield from self.search_tokens([tokens], k)[0]
+    
+    def analyze_many(self, questions, executor=None, chunksize=64):
+        # The distinct questions and their tokens, before spelling
+        # correction. Tokenizing is spread over the executor's worker
+        # processes for large batches.
+        unique = list(dict.fromkeys(questions))
+        if executor is not None and len(unique) > chunksize:
+            token_lists = list(executor.map(preprocess_text, unique, chunksize=chunksize))
+        else:
+            token_lists = [self.preprocess_text(question) for question in unique]
+        return unique, token_lists
+    
+    def search_many(self, questions, executor=None, chunksize=64, k=3):
+        # Bulk search for batch jobs: duplicates are searched once and
+        # results come back in input order. Returns the results and the
+        # spelling corrections made for each question.
+        unique, token_lists = self.analyze_many(questions, executor, chunksize)
+        corrected = [self.correct(tokens) for tokens in token_lists]
+        results = self.search_tokens([tokens for tokens, _ in corrected], k)
+        found = {question: (ranked, corrections)
+                 for question, ranked, (_, corrections) in zip(unique, results, corrected)}
+        return ([[dict(result) for result in found[question][0]] for question in questions],
+                [dict(found[question][1]) for question in questions])
+    
+    def prunes(self, snapshot):
+        # Whether single questions go through ScoringEngine.top_k. Overlap
+        # gives every term the same bound, which leaves MaxScore nothing to
+        # prune.
+        return self.retrieval == "maxscore" and snapshot.engine.mode != "overlap" and snapshot.semantic is None
+    
+    def search_tokens(self, token_lists, k=3, snapshot=None):
+        # Work against one snapshot even if a reload lands mid-request
+        if snapshot is None:
+            snapshot = self.snapshot
+        
+        # Queries with the same lemmatized terms share a cache entry
+        with metrics.stage("cache"):
+            keys = [(snapshot.version, k, frozenset(tokens)) for tokens in token_lists]
+            results = [self.cache.get(key) for key in keys]
+        
+        misses = [i for i, cached in enumerate(results) if cached is None]
+        if len(misses) == 1:
+            # A single question. Identical questions arriving while it is
+            # scored wait for this result instead of scoring it again.
+            i = misses[0]
+            results[i] = self.flights.do(keys[i], lambda: self.search_one(snapshot, token_lists[i], k, keys[i]))
+        elif misses:
+            # Score the misses with a single sparse matrix product
+            with metrics.stage("score"):
+                scores = snapshot.engine.score_batch([token_lists[i] for i in misses])
+            with metrics.stage("rank"):
+                for row, i in enumerate(misses):
+                    start, end = scores.indptr[row], scores.indptr[row + 1]
+                    doc_ids, row_scores = self.fuse(snapshot, token_lists[i], scores.indices[start:end],
+                                                    scores.data[start:end], k)
+                    results[i] = self.rank(snapshot, doc_ids, row_scores, k)
+                    self.cache.put(keys[i], results[i])
+        
+        # Hand out copies so callers can't modify cached results
+        return [[dict(result) for result in cached] for cached in results]
+    
+    def search_one(self, snapshot, tokens, k, key):
+        with metrics.stage("score"):
+            if self.prunes(snapshot):
+                # Pruned top-k retrieval, already ranked
+                doc_ids, scores = snapshot.engine.top_k(tokens, k, snapshot.thresholds)
+            else:
+                doc_ids, scores = snapshot.engine.score(tokens)
+                doc_ids, scores = self.fuse(snapshot, tokens, doc_ids, scores, k)
+        with metrics.stage("rank"):
+            if self.prunes(snapshot):
+                results = self.results(snapshot, doc_ids, scores)
+            else:
+                results = self.rank(snapshot, doc_ids, scores, k)
+            self.cache.put(key, results)
+        return results
+    
+    def fuse(self, snapshot, tokens, doc_ids, scores, k=3):
+        # With dense retrieval on, the score of each document becomes
+        #   (1 - w) * lexical score + w * max(cosine similarity, 0)
+        # over the lexical matches plus the passages nearest the query in
+        # the embedding space. Returns ascending doc ids, like score().
+        semantic = snapshot.semantic
+        if semantic is None:
+            return doc_ids, scores
+        weight = self.semantic
+        query = semantic.embed(snapshot.engine.query_terms(tokens)[0])
+        if query is None:
+            return doc_ids, (1 - weight) * scores
+        with metrics.stage("semantic"):
+            nearest, _ = semantic.search(query, max(k, SEMANTIC_CANDIDATES))
+            candidates = np.union1d(doc_ids, nearest)
+            lexical = np.zeros(len(candidates))
+            lexical[np.searchsorted(candidates, doc_ids)] = scores
+            dense = np.maximum(semantic.similarity(query, candidates), 0.0)
+        return candidates, (1 - weight) * lexical + weight * dense
+    
+    def rank(self, snapshot, doc_ids, scores, k=3):
+        passing = scores > snapshot.thresholds[doc_ids]
+        doc_ids, scores = doc_ids[passing], scores[passing]
+        
+        # Sort by relevance score; doc_ids are ascending, so the stable sort
+        # keeps ties in corpus order
+        order = np.argsort(-scores, kind="stable")[:k]
+        return self.results(snapshot, doc_ids[order], scores[order])
+    
+    def results(self, snapshot, doc_ids, scores):
+        results = []
+        for doc_id, score in zip(doc_ids.tolist(), scores.tolist()):
+            document = snapshot.documents[doc_id]
+            results.append({
+                "section": document["section"],
+                "content": document["content"],
+                "score": score,
+                "citation": document["citation"]
+            })
+        return results
+    
+    def search_exhaustive(self, query, k=3):
+        # Reference implementation that re-tokenizes every document, kept to
+        # check the indexed search against (overlap scoring only)
+        query_tokens = self.analyze_query(query)[0]
+        results = []
+        for document in self.snapshot.documents:
+            document_tokens = self.preprocess_text(document["content"])
+            score = self.calculate_relevance(query_tokens, document_tokens)
+            if score > document["threshold"]:
+                results.append({
+                    "section": document["section"],
+                    "content": document["content"],
+                    "score": score,
+                    "citation": document["citation"]
+                })
+        
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results[:k]
+    
+    def calculate_relevance(self, query_tokens, section_tokens):
+        # Simple relevance calculation based on token overlap
+        query_set = set(query_tokens)
+        section_set = set(section_tokens)
+        
+        if not query_set or not section_set:
+            return 0
+        
+        intersection = query_set.intersection(section_set)
+        return len(intersection) / len(query_set)
+    
+    def get_section_titles(self):
+        titles = []
+        for section_key, section in self.snapshot.sections.items():
+            titles.append(section["title"])
+            if "subsections" in section:
+                for subsec_key, subsec in section["subsections"].items():
+                    titles.append(f"{section['title']} - {subsec['title']}")
+        return titles
+
+
+class KnowledgeBaseWatcher(threading.Thread):
+    # Polls the data directory and reloads changed files in the background
+    def __init__(self, kb, interval=5.0):
+        super().__init__(name="knowledge-base-watcher", daemon=True)
+        self.kb = kb
+        self.interval = interval
+        self.stopped = threading.Event()
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.kb.reload()
+            except Exception:
+                # A half-written or invalid file; keep serving the old index
+                # and try again on the next tick
+                logging.getLogger(__name__).exception("Reloading %s failed", self.kb.data_dir)
+    
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,162 @@
+from contextlib import nullcontext
+import os
+import threading
+import time
+
+# Instrumentation is off unless SMALLCLAIMS_METRICS=1. When off, stage()
+# hands back one shared no-op context manager, so the hot path pays a
+# function call and nothing else.
+ENABLED = os.environ.get('SMALLCLAIMS_METRICS', '0') == '1'
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+NULL_STAGE = nullcontext()
+
+
+class Histogram:
+    # Cumulative-bucket histogram in the Prometheus sense, one series per
+    # label value
+    def __init__(self, name, help, buckets, label=None):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self.series = {}
+        self.lock = threading.Lock()
+    
+    def observe(self, value, label_value=None):
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+    
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for label_value, values in sorted(series.items(), key=lambda item: str(item[0])):
+            labels = f'{self.label}="{label_value}",' if self.label else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {values[-2]}')
+            suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{self.name}_count{suffix} {values[-2]}")
+            lines.append(f"{self.name}_sum{suffix} {values[-1]}")
+        return lines
+
+
+stage_seconds = Histogram("smallclaims_stage_seconds", "Time spent in each stage of the ask pipeline",
+                          LATENCY_BUCKETS, label="stage")
+request_seconds = Histogram("smallclaims_request_seconds", "Request latency by endpoint",
+                            LATENCY_BUCKETS, label="endpoint")
+result_count = Histogram("smallclaims_results", "Results returned per question", COUNT_BUCKETS)
+
+# Per-request stage timings, collected only for requests that asked for them
+local = threading.local()
+
+
+class Stage:
+    __slots__ = ("name", "start")
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stage_seconds.observe(elapsed, self.name)
+        timings = getattr(local, "timings", None)
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def stage(name):
+    # with metrics.stage("score"): ...
+    if not ENABLED:
+        return NULL_STAGE
+    return Stage(name)
+
+
+def begin_request(collect_timings):
+    local.timings = [] if ENABLED and collect_timings else None
+
+
+def carry_timings(function):
+    # Wraps function to run on another thread (a pool worker) and record its
+    # stages into the calling request's timings. Stages on parallel threads
+    # are summed like repeated ones, so they add up to more than wall time.
+    timings = getattr(local, "timings", None)
+    if timings is None:
+        return function
+    
+    def run(*args):
+        local.timings = timings
+        try:
+            return function(*args)
+        finally:
+            local.timings = None
+    return run
+
+
+def end_request():
+    # Returns the stage timings gathered for this request, if any
+    timings = getattr(local, "timings", None)
+    local.timings = None
+    return timings
+
+
+def server_timing(timings):
+    # Stages run more than once (e.g. per batch chunk) are summed
+    totals = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ", ".join(f"{name};dur={elapsed * 1000:.3f}" for name, elapsed in totals.items())
+
+
+def gauge(name, help, value, type="gauge"):
+    return [f"# HELP {name} {help}", f"# TYPE {name} {type}", f"{name} {value}"]
+
+
+def expose(kb=None, normalizer=None, admission=None, shards=None):
+    # Prometheus text exposition of everything above plus point-in-time
+    # values read from the knowledge base, its cache, the normalizer, the
+    # admission queue and the jurisdiction shards
+    lines = []
+    for histogram in (stage_seconds, request_seconds, result_count):
+        lines += histogram.expose()
+    if kb is not None:
+        snapshot = kb.snapshot
+        lines += gauge("smallclaims_corpus_documents", "Documents in the published index", len(snapshot.documents))
+        lines += gauge("smallclaims_corpus_terms", "Terms in the published index", len(snapshot.engine.vocabulary))
+        lines += gauge("smallclaims_index_version", "Version of the published index", snapshot.version)
+        stats = kb.cache.stats()
+        lines += gauge("smallclaims_cache_hits_total", "Query cache hits", stats["hits"], "counter")
+        lines += gauge("smallclaims_cache_misses_total", "Query cache misses", stats["misses"], "counter")
+        lines += gauge("smallclaims_cache_evictions_total", "Query cache evictions", stats["evictions"], "counter")
+        lines += gauge("smallclaims_cache_entries", "Entries in the query cache", stats["size"])
+        lines += gauge("smallclaims_coalesced_total", "Searches that waited for an identical one in flight",
+                       kb.flights.stats()["coalesced"], "counter")
+    if normalizer is not None:
+        lines += gauge("smallclaims_lemma_cache_entries", "Tokens memoized by the normalizer",
+                       normalizer.stats()["cached"])
+    if admission is not None:
+        stats = admission.stats()
+        lines += gauge("smallclaims_active_requests", "Search requests running", stats["active"])
+        lines += gauge("smallclaims_queued_requests", "Search requests waiting for a slot", stats["waiting"])
+        lines += ["# HELP smallclaims_shed_total Search requests turned away with a 503",
+                  "# TYPE smallclaims_shed_total counter"]
+        lines += [f'smallclaims_shed_total{{reason="{reason}"}} {count}'
+                  for reason, count in sorted(stats["shed"].items())]
+    if shards is not None:
+        lines += gauge("smallclaims_shards_loaded", "Jurisdictions with an index in memory", len(shards.loaded()))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,237 @@
+import heapq
+import math
+
+import numpy as np
+from scipy import sparse
+
+
+# Scoring modes understood by ScoringEngine
+SCORING_MODES = ("overlap", "tfidf", "bm25")
+
+# Slack when pruning on upper bounds, so partial sums added in a different
+# order than the exact score can never drop a document that belongs
+PRUNE_EPSILON = 1e-9
+
+
+class ScoringEngine:
+    # Holds the corpus as a sparse document-term matrix and scores queries
+    # against it with one sparse matrix product per batch of queries.
+    #
+    # Every mode returns scores normalised to roughly [0, 1] so the relevance
+    # thresholds used by KnowledgeBase.search keep their meaning:
+    #   overlap - distinct query terms found in the document / query terms
+    #   tfidf   - cosine similarity between tf-idf vectors
+    #   bm25    - BM25 divided by the summed idf of the query terms
+    def __init__(self, index, num_docs, mode="overlap", k1=1.2, b=0.75):
+        if mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {mode}")
+        self.mode = mode
+        self.k1 = k1
+        self.b = b
+        self.num_docs = num_docs
+        self.vocabulary = {term: term_id for term_id, term in enumerate(index)}
+        
+        # Term frequencies as a docs x terms matrix
+        rows, cols, counts = [], [], []
+        for term, postings in index.items():
+            term_id = self.vocabulary[term]
+            for doc_id, tf in postings.items():
+                rows.append(doc_id)
+                cols.append(term_id)
+                counts.append(tf)
+        shape = (num_docs, len(self.vocabulary))
+        tf = sparse.csr_matrix((np.array(counts, dtype=np.float64), (rows, cols)), shape=shape)
+        
+        df = np.diff(tf.tocsc().indptr).astype(np.float64)
+        self.idf = self._idf(df)
+        self.oov_idf = float(self._idf(np.zeros(1))[0])
+        
+        weights = self._weights(tf)
+        # Stored transposed (terms x docs) so each row is a term's postings
+        self.term_weights = weights.T.tocsr()
+        self.term_weights.sort_indices()
+        self.max_weights = self._max_weights()
+    
+    @classmethod
+    def from_arrays(cls, mode, num_docs, vocabulary, idf, oov_idf, term_weights):
+        # Rebuild an engine around precomputed weights, e.g. arrays mapped
+        # from an index file. vocabulary only needs get() and len().
+        if mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {mode}")
+        engine = cls.__new__(cls)
+        engine.mode = mode
+        engine.num_docs = num_docs
+        engine.vocabulary = vocabulary
+        engine.idf = idf
+        engine.oov_idf = oov_idf
+        engine.term_weights = term_weights
+        engine.max_weights = engine._max_weights()
+        return engine
+    
+    def _max_weights(self):
+        # Largest weight in each term's postings: the most that term can add
+        # to any document's score
+        weights = self.term_weights
+        maxima = np.zeros(weights.shape[0])
+        nonempty = np.diff(weights.indptr) > 0
+        if nonempty.any():
+            maxima[nonempty] = np.maximum.reduceat(weights.data, weights.indptr[:-1][nonempty])
+        return maxima
+    
+    def document_counts(self):
+        # (term, number of documents containing it) pairs; both kinds of
+        # vocabulary iterate in term id order
+        return zip(self.vocabulary, np.diff(self.term_weights.indptr).tolist())
+    
+    def _idf(self, df):
+        n = self.num_docs
+        if self.mode == "bm25":
+            return np.log(1 + (n - df + 0.5) / (df + 0.5))
+        # Smoothed idf, defined even for terms that appear in no document
+        return np.log((n + 1) / (df + 1)) + 1
+    
+    def _weights(self, tf):
+        if self.mode == "overlap":
+            weights = tf.copy()
+            weights.data[:] = 1.0
+            return weights
+        
+        if self.mode == "tfidf":
+            weights = tf.multiply(self.idf).tocsr()
+            norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+            norms[norms == 0] = 1.0
+            # Query vectors are binary, so fold the query-side idf in here too
+            return sparse.diags(1 / norms).dot(weights).multiply(self.idf).tocsr()
+        
+        # BM25 term saturation with document length normalisation
+        doc_lengths = np.asarray(tf.sum(axis=1)).ravel()
+        avg_length = doc_lengths.mean() if len(doc_lengths) else 0.0
+        weights = tf.tocoo()
+        length_norm = 1 - self.b + self.b * doc_lengths[weights.row] / (avg_length or 1.0)
+        data = weights.data * (self.k1 + 1) / (weights.data + self.k1 * length_norm)
+        data *= self.idf[weights.col]
+        return sparse.csr_matrix((data, (weights.row, weights.col)), shape=tf.shape)
+    
+    def _term_norm(self, term_id):
+        # Contribution of one query term to the query's normaliser
+        if self.mode == "overlap":
+            return 1.0
+        idf = self.oov_idf if term_id is None else self.idf[term_id]
+        return idf * idf if self.mode == "tfidf" else idf
+    
+    def query_terms(self, tokens):
+        # Ascending term ids of the query's known terms, and its normaliser
+        term_ids = []
+        norm = 0.0
+        for token in set(tokens):
+            term_id = self.vocabulary.get(token)
+            norm += self._term_norm(term_id)
+            if term_id is not None:
+                term_ids.append(term_id)
+        term_ids.sort()
+        return term_ids, math.sqrt(norm) if self.mode == "tfidf" else norm
+    
+    def query_matrix(self, queries):
+        # Binary queries x terms matrix plus the normaliser of each query.
+        # Each row's terms are in ascending order, which fixes the order the
+        # product adds up a document's weights in (top_k relies on this).
+        rows, cols = [], []
+        norms = np.zeros(len(queries))
+        for query_id, tokens in enumerate(queries):
+            term_ids, norms[query_id] = self.query_terms(tokens)
+            rows += [query_id] * len(term_ids)
+            cols += term_ids
+        shape = (len(queries), len(self.vocabulary))
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=shape)
+        return matrix, norms
+    
+    def score_batch(self, queries):
+        # Score a list of token lists at once. Returns a sparse
+        # queries x docs matrix holding only the documents each query touches.
+        matrix, norms = self.query_matrix(queries)
+        scores = matrix.dot(self.term_weights).tocsr()
+        scores.sort_indices()
+        counts = np.diff(scores.indptr)
+        # Divide rather than multiply by 1 / norm so overlap scores match
+        # len(intersection) / len(query) exactly
+        scores.data = scores.data / np.repeat(norms, counts)
+        return scores
+    
+    def score(self, query_tokens):
+        # Document ids (ascending) and scores for a single query
+        scores = self.score_batch([query_tokens])
+        return scores.indices, scores.data
+    
+    def top_k(self, query_tokens, k, thresholds):
+        # The k best documents scoring above their threshold (thresholds is
+        # a per-document array), best first, ties broken by document id.
+        # Gives exactly what scoring every document and sorting would, but
+        # uses MaxScore pruning: each term's largest weight bounds what it
+        # can add, so once k documents are known to qualify, documents that
+        # cannot catch up are dropped and the remaining low-impact terms are
+        # only looked up for the surviving candidates instead of being
+        # merged in.
+        term_ids, norm = self.query_terms(query_tokens)
+        if not term_ids or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        weights = self.term_weights
+        postings = [(weights.indices[weights.indptr[t]:weights.indptr[t + 1]],
+                     weights.data[weights.indptr[t]:weights.indptr[t + 1]]) for t in term_ids]
+        
+        # Highest-impact terms first; remaining[i] bounds what terms i.. can add
+        bounds = self.max_weights[term_ids] / norm
+        order = np.argsort(-bounds, kind="stable")
+        remaining = np.append(np.cumsum(bounds[order][::-1])[::-1], 0.0)
+        floor = thresholds.min() if len(thresholds) else 0.0
+        kth_best = -np.inf
+        
+        # Partial scores accumulate in a dense array; dropped documents are
+        # set to -inf so later postings can't bring them back
+        accumulator = np.zeros(self.num_docs)
+        candidates = np.zeros(0, dtype=np.int64)
+        partial = np.zeros(0)
+        for i, j in enumerate(order):
+            doc_ids, term_weights = postings[j]
+            if remaining[i] > floor - PRUNE_EPSILON and remaining[i] >= kth_best - PRUNE_EPSILON:
+                # Documents with only terms i.. can still qualify: merge in
+                # the whole postings list
+                accumulator[candidates] = partial
+                new = doc_ids[accumulator[doc_ids] == 0]
+                accumulator[doc_ids] += term_weights / norm
+                candidates = np.concatenate([candidates, new])
+                partial = accumulator[candidates]
+            elif len(candidates):
+                # Only existing candidates can still make it: look them up
+                positions = np.minimum(np.searchsorted(doc_ids, candidates), len(doc_ids) - 1)
+                found = doc_ids[positions] == candidates
+                partial[found] += term_weights[positions[found]] / norm
+            
+            # Drop candidates that can no longer pass their threshold or
+            # reach the current k-th best score
+            best_case = partial + remaining[i + 1]
+            keep = (best_case > thresholds[candidates] - PRUNE_EPSILON) & (best_case >= kth_best - PRUNE_EPSILON)
+            accumulator[candidates[~keep]] = -np.inf
+            candidates, partial = candidates[keep], partial[keep]
+            
+            # Partial scores only grow, so the k-th best partial score of
+            # documents already past their threshold is a floor for the answer
+            qualified = partial[partial > thresholds[candidates]]
+            if len(qualified) >= k:
+                kth_best = max(kth_best, np.partition(qualified, len(qualified) - k)[len(qualified) - k])
+        
+        if not len(candidates):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        
+        # Exact scores for the survivors, summed in ascending term order
+        # exactly as score_batch's matrix product does
+        exact = np.zeros(len(candidates))
+        for doc_ids, term_weights in postings:
+            positions = np.minimum(np.searchsorted(doc_ids, candidates), len(doc_ids) - 1)
+            found = doc_ids[positions] == candidates
+            exact[found] += term_weights[positions[found]]
+        exact = exact / norm
+        
+        passing = exact > thresholds[candidates]
+        best = heapq.nsmallest(k, zip((-exact[passing]).tolist(), candidates[passing].tolist()))
+        return (np.array([doc_id for _, doc_id in best], dtype=np.int64),
+                np.array([-score for score, _ in best]))
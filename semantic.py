@@ -0,0 +1,161 @@
+# Dense retrieval for paraphrases that share few exact terms with a passage.
+# Passages are embedded once, when the index is built, with latent semantic
+# analysis: a truncated SVD of the idf-weighted document-term matrix, done
+# with a randomized range finder so it needs nothing beyond numpy/scipy and
+# no network. A query is embedded by summing the vectors of its terms.
+#
+# The passage vectors live in one contiguous float32 array, grouped by an
+# inverted-file (IVF) index: spherical k-means splits the passages into
+# lists, and a query only scans the lists whose centroids are closest to
+# it. Small corpora skip the lists and scan everything.
+import numpy as np
+from scipy import sparse
+
+# Below this many passages a brute-force scan is as fast as probing lists.
+# From benchmarks/dense.py: at 3000 passages the scan took 42 us against
+# 106 us for the lists, at 10000 the two were within 15%, and from 20000
+# up the lists win.
+IVF_MIN_DOCS = 20000
+# Share of the lists a query scans. With a fixed number of probes, recall
+# falls as the corpus (and the number of lists) grows: 16 probes gave a
+# recall@10 of 0.87 at 20000 passages but 0.62 at 100000.
+PROBE_FRACTION = 0.3
+MIN_PROBES = 16
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def randomized_svd(matrix, rank, oversample=10, iterations=4, seed=0):
+    # Halko, Martinsson & Tropp: project onto a random subspace, sharpen it
+    # with a few power iterations, then take an exact SVD of the small
+    # projected matrix. Returns the right singular vectors (terms x rank).
+    rng = np.random.default_rng(seed)
+    size = min(rank + oversample, min(matrix.shape))
+    basis = matrix.dot(rng.standard_normal((matrix.shape[1], size)))
+    basis, _ = np.linalg.qr(basis)
+    for _ in range(iterations):
+        basis, _ = np.linalg.qr(matrix.T.dot(basis))
+        basis, _ = np.linalg.qr(matrix.dot(basis))
+    _, _, right = np.linalg.svd(np.asarray(matrix.T.dot(basis)).T, full_matrices=False)
+    return right[:rank].T
+
+
+def spherical_kmeans(vectors, lists, iterations=10, sample=20000, seed=0):
+    # Centroids of unit vectors, trained on a sample of them
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors.dot(centroids.T), axis=1)
+        members = sparse.csr_matrix((np.ones(len(vectors)), (assignment, np.arange(len(vectors)))),
+                                    shape=(lists, len(vectors)))
+        sums = np.asarray(members.dot(vectors))
+        empty = np.bincount(assignment, minlength=lists) == 0
+        # Reseed empty lists with random points rather than losing them
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def assign(vectors, centroids, chunk=8192):
+    return np.concatenate([np.argmax(vectors[start:start + chunk].dot(centroids.T), axis=1)
+                           for start in range(0, len(vectors), chunk)] or [np.zeros(0, dtype=np.int64)])
+
+
+def top(similarities, k):
+    # Indices of the k largest similarities, largest first, ties by index
+    if len(similarities) > k:
+        picked = np.argpartition(-similarities, k - 1)[:k]
+    else:
+        picked = np.arange(len(similarities))
+    return picked[np.lexsort((picked, -similarities[picked]))]
+
+
+class SemanticIndex:
+    def __init__(self, term_vectors, vectors, doc_ids, list_ptr, centroids):
+        # term_vectors  terms x dims, what each query term adds
+        # vectors       docs x dims unit vectors, contiguous float32, in list order
+        # doc_ids       document id of each row of vectors
+        # list_ptr      rows list_ptr[i]:list_ptr[i + 1] belong to list i
+        # centroids     lists x dims; none when every query scans everything
+        self.term_vectors = term_vectors
+        self.vectors = vectors
+        self.doc_ids = doc_ids
+        self.rows = np.empty(len(doc_ids), dtype=np.int64)
+        self.rows[doc_ids] = np.arange(len(doc_ids))
+        self.list_ptr = list_ptr
+        self.centroids = centroids
+        self.probes = 0
+        if centroids is not None:
+            self.probes = min(len(centroids), max(MIN_PROBES, int(np.ceil(PROBE_FRACTION * len(centroids)))))
+    
+    @classmethod
+    def build(cls, engine, dims=64, lists=None, seed=0):
+        # Embeds every passage of a ScoringEngine's corpus
+        weights = engine.term_weights
+        num_terms, num_docs = weights.shape
+        dims = max(1, min(dims, num_terms - 1, num_docs - 1))
+        if num_terms < 2 or num_docs < 2:
+            empty = np.zeros((num_terms, 1), dtype=np.float32)
+            return cls(empty, np.zeros((num_docs, 1), dtype=np.float32), np.arange(num_docs),
+                       np.array([0, num_docs]), None)
+        
+        # Documents x terms, idf where the term occurs, each row unit length
+        presence = sparse.csr_matrix((np.ones(weights.nnz), weights.indices, weights.indptr), shape=weights.shape)
+        matrix = sparse.diags(np.asarray(engine.idf, dtype=np.float64)).dot(presence).T.tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        matrix = sparse.diags(1 / norms).dot(matrix).tocsr()
+        
+        components = randomized_svd(matrix, dims, seed=seed)
+        term_vectors = np.ascontiguousarray(components * np.asarray(engine.idf)[:, None], dtype=np.float32)
+        vectors = normalize_rows(np.asarray(matrix.dot(components))).astype(np.float32)
+        
+        if lists is None:
+            lists = int(np.sqrt(num_docs) / 2) if num_docs >= IVF_MIN_DOCS else 1
+        if lists <= 1:
+            return cls(term_vectors, np.ascontiguousarray(vectors), np.arange(num_docs),
+                       np.array([0, num_docs]), None)
+        centroids = spherical_kmeans(vectors, lists, seed=seed)
+        assignment = assign(vectors, centroids)
+        doc_ids = np.argsort(assignment, kind="stable")
+        list_ptr = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=lists))])
+        return cls(term_vectors, np.ascontiguousarray(vectors[doc_ids]), doc_ids, list_ptr, centroids)
+    
+    def embed(self, term_ids):
+        # Unit vector for a query, from the ids of its known terms
+        vector = self.term_vectors[term_ids].sum(axis=0) if len(term_ids) else np.zeros(self.vectors.shape[1])
+        norm = np.linalg.norm(vector)
+        return (vector / norm).astype(np.float32) if norm else None
+    
+    def similarity(self, query, doc_ids):
+        # Cosine similarity between a query vector and the given documents
+        return self.vectors[self.rows[doc_ids]].dot(query)
+    
+    def search(self, query, k, probes=None):
+        # Approximate top k: document ids and similarities, best first
+        if self.centroids is None:
+            return self.search_exact(query, k)
+        if probes is None:
+            probes = self.probes
+        nearest = top(self.centroids.dot(query), probes)
+        ranges = [(self.list_ptr[i], self.list_ptr[i + 1]) for i in nearest.tolist()]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        similarities = np.concatenate([self.vectors[start:end].dot(query) for start, end in ranges])
+        best = top(similarities, k)
+        return self.doc_ids[rows[best]], similarities[best]
+    
+    def search_exact(self, query, k):
+        # Brute force over every passage
+        similarities = self.vectors.dot(query)
+        best = top(similarities, k)
+        return self.doc_ids[best], similarities[best]
+    
+    def memory(self):
+        return sum(array.nbytes for array in (self.term_vectors, self.vectors, self.doc_ids, self.rows)
+                   if array is not None)
@@ -0,0 +1,183 @@
+# Serves several jurisdictions (courts or states) from one deployment. The
+# data directory's own files are the default jurisdiction, and each
+# subdirectory is another one: data/nj/*.json is jurisdiction "nj". Every
+# jurisdiction is a shard, a KnowledgeBase with its own index, cache and
+# spelling dictionary.
+#
+# A shard is loaded the first time a request names it, so memory grows with
+# the jurisdictions in use, not with everything on disk; max_loaded caps how
+# many stay loaded (least recently used first out, never the default). A
+# question is only searched on the shards it names. With more than one, they
+# are searched in parallel on a thread pool and their top k merged.
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import os
+import re
+import threading
+
+from knowledge_base import DATA_DIR, KnowledgeBase, KnowledgeBaseWatcher
+import metrics
+
+# Jurisdiction names double as directory names
+JURISDICTION_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+
+
+class UnknownJurisdiction(KeyError):
+    pass
+
+
+class ShardedKnowledgeBase:
+    # factory(data_dir, jurisdiction) builds one shard's KnowledgeBase
+    def __init__(self, data_dir=None, default="ny", factory=None, max_loaded=0, max_workers=None,
+                 reload_interval=0):
+        self.data_dir = data_dir or DATA_DIR
+        self.default = default
+        self.factory = factory or (lambda data_dir, jurisdiction: KnowledgeBase(data_dir=data_dir))
+        self.max_loaded = max_loaded
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.reload_interval = reload_interval
+        # Loaded shards, least recently used first
+        self.shards = OrderedDict()
+        self.watchers = {}
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.executor = None
+    
+    def path(self, jurisdiction):
+        if jurisdiction == self.default:
+            return self.data_dir
+        if not JURISDICTION_NAME.match(jurisdiction):
+            return None
+        path = os.path.join(self.data_dir, jurisdiction)
+        return path if os.path.isdir(path) else None
+    
+    def jurisdictions(self):
+        # Every jurisdiction on disk, loaded or not
+        names = {self.default}
+        for name in os.listdir(self.data_dir):
+            if JURISDICTION_NAME.match(name) and os.path.isdir(os.path.join(self.data_dir, name)):
+                names.add(name)
+        return sorted(names)
+    
+    def loaded(self):
+        with self.lock:
+            return list(self.shards)
+    
+    def shard(self, jurisdiction):
+        with self.lock:
+            kb = self.shards.get(jurisdiction)
+            if kb is not None:
+                self.shards.move_to_end(jurisdiction)
+                return kb
+        path = self.path(jurisdiction)
+        if path is None:
+            raise UnknownJurisdiction(jurisdiction)
+        
+        # One load at a time; searches on loaded shards carry on meanwhile
+        with self.load_lock:
+            kb = self.shards.get(jurisdiction)
+            if kb is not None:
+                return kb
+            kb = self.factory(path, jurisdiction)
+            if self.reload_interval > 0 and kb.data_dir:
+                self.watchers[jurisdiction] = KnowledgeBaseWatcher(kb, self.reload_interval)
+                self.watchers[jurisdiction].start()
+            evicted = []
+            with self.lock:
+                self.shards[jurisdiction] = kb
+                # Unload the least recently used, keeping the default and
+                # the shard just loaded
+                for name in list(self.shards):
+                    if not self.max_loaded or len(self.shards) <= self.max_loaded:
+                        break
+                    if name not in (self.default, jurisdiction):
+                        del self.shards[name]
+                        evicted.append(name)
+            for name in evicted:
+                watcher = self.watchers.pop(name, None)
+                if watcher is not None:
+                    watcher.stop()
+        return kb
+    
+    def route(self, jurisdictions=None):
+        # [(name, shard)] for the named jurisdictions, the default when none
+        # are named. Raises UnknownJurisdiction.
+        names = list(dict.fromkeys(jurisdictions or [self.default]))
+        return [(name, self.shard(name)) for name in names]
+    
+    def fan_out(self, function, shards):
+        # function(name, shard) on every shard, on the pool when there are several
+        if len(shards) == 1:
+            return [function(*shards[0])]
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                       thread_name_prefix="shard-search")
+        # Stages timed on the pool count towards this request's Server-Timing
+        return list(self.executor.map(metrics.carry_timings(lambda item: function(*item)), shards))
+    
+    @staticmethod
+    def merge(found, k):
+        # Best k of several shards' ranked results; ties go to the shard
+        # named first, then to the better rank within it
+        entries = ((-result["score"], shard, rank, result)
+                   for shard, results in enumerate(found) for rank, result in enumerate(results))
+        return [entry[3] for entry in heapq.nsmallest(k, entries, key=lambda entry: entry[:3])]
+    
+    @staticmethod
+    def merge_corrections(found):
+        # Each shard corrects against its own vocabulary; the shard named
+        # first wins when two correct the same word differently
+        corrections = {}
+        for shard_corrections in found:
+            for original, corrected in shard_corrections.items():
+                corrections.setdefault(original, corrected)
+        return corrections
+    
+    def search_corrected(self, query, k=3, jurisdictions=None):
+        # Results (each tagged with its "jurisdiction") and the spelling
+        # corrections made, which each shard makes against its own vocabulary
+        shards = self.route(jurisdictions)
+        tokens = shards[0][1].preprocess_text(query)
+        
+        def search_shard(name, kb):
+            corrected, corrections = kb.correct(tokens)
+            return [dict(result, jurisdiction=name) for result in kb.search_tokens([corrected], k)[0]], corrections
+        
+        found = self.fan_out(search_shard, shards)
+        return (self.merge([results for results, _ in found], k),
+                self.merge_corrections([corrections for _, corrections in found]))
+    
+    def search(self, query, k=3, jurisdictions=None):
+        return self.search_corrected(query, k, jurisdictions)[0]
+    
+    def search_many(self, questions, executor=None, chunksize=64, k=3, jurisdictions=None):
+        # Like search_corrected: the batch is tokenized once, and only
+        # correction and scoring run on each shard. Returns the results and
+        # the spelling corrections made for each question, in input order.
+        shards = self.route(jurisdictions)
+        unique, token_lists = shards[0][1].analyze_many(questions, executor, chunksize)
+        
+        def search_shard(name, kb):
+            corrected = [kb.correct(tokens) for tokens in token_lists]
+            results = kb.search_tokens([tokens for tokens, _ in corrected], k)
+            return ([[dict(result, jurisdiction=name) for result in found] for found in results],
+                    [corrections for _, corrections in corrected])
+        
+        found = self.fan_out(search_shard, shards)
+        # Regroup from per shard to per question
+        results = zip(*(results for results, _ in found))
+        corrections = zip(*(corrections for _, corrections in found))
+        merged = {question: (self.merge(ranked, k), self.merge_corrections(fixes))
+                  for question, ranked, fixes in zip(unique, results, corrections)}
+        return ([[dict(result) for result in merged[question][0]] for question in questions],
+                [dict(merged[question][1]) for question in questions])
+    
+    def reload(self):
+        # Reloads every loaded shard; returns {jurisdiction: {"changed":
+        # changed sources, "version": index version}}
+        with self.lock:
+            shards = list(self.shards.items())
+        return {name: {"changed": kb.reload(), "version": kb.version} for name, kb in shards}
@@ -0,0 +1,167 @@
+# Typo correction for query terms against the corpus vocabulary, using
+# symmetric deletes (SymSpell): every term is stored under each string
+# reachable from it by deleting up to max_distance characters, so a
+# misspelling finds its candidates by generating its own deletes and
+# looking them up, instead of computing an edit distance to every term.
+# Only the first prefix_length characters are expanded, which bounds the
+# deletes per term; candidates are then checked with a real edit distance.
+from cache import QueryCache
+
+
+def edit_distance(a, b, limit):
+    # Optimal string alignment distance (insertions, deletions,
+    # substitutions and swaps of adjacent characters), or limit + 1 once
+    # it is known to exceed limit
+    # Candidates usually share most of their prefix with the word, so
+    # trim what the two have in common before filling in the table
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a or not b:
+        return max(len(a), len(b))
+    
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            value = previous[j - 1] + (a[i - 1] != b[j - 1])
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def allowed_distance(word, max_distance):
+    # Short words get less room: "cat" is not a typo of "car". 4-6
+    # letters allow one edit, 7 or more allow two.
+    return min(max_distance, (len(word) - 1) // 3)
+
+
+class SymSpell:
+    def __init__(self, terms, max_distance=2, prefix_length=7, memo_size=4096, known=None):
+        # terms: (term, count) pairs; the count breaks ties between
+        # candidates at the same distance. Only alphabetic terms take part.
+        # known(word) is true for real words that must be left alone even
+        # though the corpus lacks them ("statute" is not a typo of "state").
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.known = known
+        # Popular misspellings come back often; "" records "no correction".
+        # Keys carry the generation, which every update() bumps, so nothing
+        # memoized against an older vocabulary is served after it.
+        self.memo = QueryCache(maxsize=memo_size)
+        self.generation = 0
+        self.counts = {}
+        self.deletes = {}
+        self.update(terms)
+    
+    def __len__(self):
+        return len(self.counts)
+    
+    @staticmethod
+    def eligible(term):
+        return term.isalpha() and len(term) >= 4
+    
+    def update(self, terms):
+        # Brings the dictionary in line with terms, (term, count) pairs for
+        # the whole vocabulary. Only terms that appeared or disappeared since
+        # the last call generate deletes, so a reload that changes one file
+        # costs what that file adds or removes, not a rebuild. Lists in
+        # deletes are replaced, never changed in place, and counts covers
+        # old and new terms until the deletes are done, so lookups running
+        # meanwhile always find what they need.
+        if self.max_distance <= 0:
+            return
+        counts = {term: count for term, count in terms if self.eligible(term)}
+        added, removed = {}, {}
+        for term in self.counts.keys() - counts.keys():
+            for delete in self.edits(term[:self.prefix_length], self.max_distance):
+                removed.setdefault(delete, set()).add(term)
+        for term in sorted(counts.keys() - self.counts.keys()):
+            for delete in self.edits(term[:self.prefix_length], self.max_distance):
+                added.setdefault(delete, []).append(term)
+        
+        self.counts = {**self.counts, **counts}
+        for delete in removed.keys() | added.keys():
+            gone = removed.get(delete, ())
+            candidates = [term for term in self.deletes.get(delete, ()) if term not in gone]
+            candidates += added.get(delete, [])
+            if candidates:
+                self.deletes[delete] = candidates
+            else:
+                self.deletes.pop(delete, None)
+        self.counts = counts
+        self.generation += 1
+        self.memo.clear()
+    
+    @staticmethod
+    def edits(word, distance):
+        # word and every string left after deleting up to distance characters
+        found = {word}
+        frontier = {word}
+        for _ in range(distance):
+            frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier
+                        for i in range(len(candidate))} - found
+            found |= frontier
+        return found
+    
+    def correct(self, word):
+        # The closest known term to word, or None when word is known, a real
+        # word, not a word or too far from everything. Ties go to the more
+        # frequent term.
+        if self.knows(word) or not word.isalpha():
+            return None
+        key = (self.generation, word)
+        correction = self.memo.get(key)
+        if correction is None:
+            if self.known is not None and self.known(word):
+                correction = ""
+            else:
+                correction = self.closest(word) or ""
+            self.memo.put(key, correction)
+        return correction or None
+    
+    def knows(self, word):
+        return word in self.counts
+    
+    def candidates(self, delete):
+        # (term, count) for the terms stored under delete. The count is None
+        # for a term an update() running meanwhile has dropped.
+        counts = self.counts
+        return [(term, counts.get(term)) for term in self.deletes.get(delete, ())]
+    
+    def closest(self, word):
+        limit = allowed_distance(word, self.max_distance)
+        if limit <= 0:
+            return None
+        best = None
+        checked = set()
+        for delete in self.edits(word[:self.prefix_length], limit):
+            for term, count in self.candidates(delete):
+                if term in checked or count is None:
+                    continue
+                checked.add(term)
+                # Nothing further away than the best so far can win
+                distance = edit_distance(word, term, best[0] if best else limit)
+                if distance <= limit:
+                    candidate = (distance, -count, term)
+                    if best is None or candidate < best:
+                        best = candidate
+        return best[2] if best else None
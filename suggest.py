@@ -0,0 +1,185 @@
+from bisect import bisect_left
+import threading
+import time
+
+import numpy as np
+
+# Sorts after any character a key can contain, so prefix + END bounds
+# every key starting with prefix
+END = "\U0010ffff"
+
+# Shorter words are not completed from the vocabulary: "i" or "a" would
+# match half of it
+MIN_COMPLETION_PREFIX = 2
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+class PrefixIndex:
+    # Immutable sorted array of keys. The keys starting with a prefix form
+    # one contiguous range, found with two binary searches; the best n in
+    # that range come from a partial sort of precomputed ranks.
+    def __init__(self, entries):
+        # entries: key -> (text, weight)
+        self.keys = sorted(entries)
+        self.texts = [entries[key][0] for key in self.keys]
+        weights = np.array([entries[key][1] for key in self.keys], dtype=np.float64)
+        # Rank 0 is the heaviest entry; ties go to the smaller key, so
+        # results never depend on how the partial sort splits them
+        order = np.lexsort((np.arange(len(self.keys)), -weights))
+        self.ranks = np.empty(len(self.keys), dtype=np.int32)
+        self.ranks[order] = np.arange(len(self.keys), dtype=np.int32)
+        self.weights = weights
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def top(self, prefix, n):
+        # The n heaviest (text, weight) pairs whose key starts with prefix
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + END, lo)
+        if hi - lo <= 0 or n <= 0:
+            return []
+        ranks = self.ranks[lo:hi]
+        if hi - lo > n:
+            picked = np.argpartition(ranks, n - 1)[:n]
+            picked = picked[np.argsort(ranks[picked])]
+        else:
+            picked = np.argsort(ranks)
+        return [(self.texts[lo + i], self.weights[lo + i]) for i in picked.tolist()]
+
+
+class Suggester:
+    # Typeahead suggestions for /api/suggest, from three sources:
+    #   titles and popular questions - matched against the whole input and
+    #     ranked by how often they were asked (titles count as asked once)
+    #   vocabulary - completes the word being typed, ranked by the number
+    #     of documents the term appears in
+    # Phrases come first, then word completions fill the remaining slots.
+    #
+    # The question log keeps at most max_questions distinct questions; when
+    # full, the less frequent half is dropped. A logged question is shown
+    # to other users only once it has been asked min_count times, so one
+    # user's text (and whatever personal details it holds) is never offered
+    # to everyone after a single ask. Logged questions show up in
+    # suggestions after at most rebuild_interval seconds, plus the time a
+    # background rebuild takes; suggest() never waits for one. The title
+    # and vocabulary indexes are rebuilt when the knowledge base is reloaded.
+    def __init__(self, kb, max_questions=10000, min_count=10, rebuild_interval=5.0, clock=time.monotonic):
+        self.kb = kb
+        self.max_questions = max_questions
+        self.min_count = min_count
+        self.rebuild_interval = rebuild_interval
+        self.clock = clock
+        # lock guards the question log; rebuild_lock serializes rebuilds
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+        self.refreshing = False
+        self.rebuilds = 0
+        self.questions = {}
+        self.dirty = False
+        self.built_at = None
+        self.version = None
+        self.titles = {}
+        self.phrases = PrefixIndex({})
+        self.terms = PrefixIndex({})
+    
+    def record(self, question):
+        key = normalize(question)
+        if not key:
+            return
+        with self.lock:
+            entry = self.questions.get(key)
+            if entry is None:
+                if len(self.questions) >= self.max_questions:
+                    self.trim()
+                entry = self.questions[key] = [question.strip(), 0]
+            entry[1] += 1
+            self.dirty = True
+    
+    def trim(self):
+        # Called with the lock held. Keeps the more frequent half; ties go
+        # to the smaller key, as in PrefixIndex, so the outcome never
+        # depends on the order questions arrived in.
+        ranked = sorted(self.questions.items(), key=lambda item: (-item[1][1], item[0]))
+        self.questions = dict(ranked[:self.max_questions // 2])
+    
+    def refresh(self):
+        # Rebuild whichever indexes are stale. Searches keep using the old
+        # ones until the new ones are assigned, and record() only waits
+        # while the question log is copied.
+        snapshot = self.kb.snapshot
+        if not self.stale(snapshot):
+            return
+        with self.rebuild_lock:
+            # Another thread may have rebuilt while this one waited
+            if not self.stale(snapshot):
+                return
+            if snapshot.version != self.version:
+                self.titles = {normalize(title): title for title in self.kb.get_section_titles()}
+                self.terms = PrefixIndex(self.term_entries(snapshot.engine))
+            with self.lock:
+                questions = [(key, text, count) for key, (text, count) in self.questions.items()
+                             if count >= self.min_count or key in self.titles]
+                self.built_at = self.clock()
+                self.dirty = False
+            entries = {key: (title, 1) for key, title in self.titles.items()}
+            for key, text, count in questions:
+                entries[key] = (entries[key][0], count + 1) if key in entries else (text, count)
+            self.phrases = PrefixIndex(entries)
+            self.version = snapshot.version
+            self.rebuilds += 1
+    
+    def refresh_in_background(self):
+        # At most one background rebuild at a time
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self.refreshing = False
+        threading.Thread(target=run, name="suggest-refresh", daemon=True).start()
+    
+    def stale(self, snapshot):
+        if snapshot.version != self.version:
+            return True
+        return self.dirty and self.clock() - self.built_at >= self.rebuild_interval
+    
+    @staticmethod
+    def term_entries(engine):
+        return {term: (term, count) for term, count in engine.document_counts() if count}
+    
+    def suggest(self, text, n=8):
+        if self.version is None:
+            # Nothing to serve until the first build
+            self.refresh()
+        elif self.stale(self.kb.snapshot):
+            self.refresh_in_background()
+        key = normalize(text)
+        if not key:
+            return []
+        suggestions = [{"text": phrase, "kind": "title" if normalize(phrase) in self.titles else "question"}
+                       for phrase, _ in self.phrases.top(key, n)]
+        word = text.split()[-1]
+        if len(suggestions) < n and not text[-1].isspace() and len(word) >= MIN_COMPLETION_PREFIX:
+            # Complete the last word from the vocabulary
+            head = text[:len(text) - len(word)]
+            seen = {normalize(suggestion["text"]) for suggestion in suggestions}
+            for term, _ in self.terms.top(word.lower(), n):
+                completion = head + term
+                if normalize(completion) not in seen:
+                    suggestions.append({"text": completion, "kind": "term"})
+                    if len(suggestions) == n:
+                        break
+        return suggestions
+    
+    def stats(self):
+        with self.lock:
+            return {"questions": len(self.questions), "phrases": len(self.phrases), "terms": len(self.terms),
+                    "rebuilds": self.rebuilds}
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+import app
+from admission import AdmissionQueue, Rejected
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_full_queue_is_shed():
+    queue = AdmissionQueue(max_active=1, max_queue=1, max_wait=5.0)
+    token = queue.enter()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(queue.enter()))
+    waiter.start()
+    wait_until(lambda: queue.stats()["waiting"] == 1)
+    
+    with pytest.raises(Rejected) as rejected:
+        queue.enter()
+    assert rejected.value.reason == "queue_full"
+    
+    # The waiting request gets the slot once it is free
+    queue.leave(token)
+    waiter.join()
+    assert len(admitted) == 1
+    queue.leave(admitted[0])
+    stats = queue.stats()
+    assert (stats["active"], stats["waiting"], stats["admitted"]) == (0, 0, 2)
+    assert stats["shed"] == {"queue_full": 1}
+
+
+def test_wait_times_out():
+    queue = AdmissionQueue(max_active=1, max_queue=1, max_wait=0.05)
+    queue.enter()
+    with pytest.raises(Rejected) as rejected:
+        queue.enter()
+    assert rejected.value.reason == "timeout"
+    assert queue.stats()["waiting"] == 0
+
+
+def test_slow_requests_shed_instead_of_queueing():
+    clock = Clock()
+    queue = AdmissionQueue(max_active=1, max_queue=4, max_latency=0.5, retry_after=1, smoothing=0.5, clock=clock)
+    token = queue.enter()
+    clock.now = 4.0
+    queue.leave(token)
+    assert queue.stats()["latency"] == 2.0
+    
+    # A free slot is still handed out...
+    token = queue.enter()
+    # ...but nobody queues behind a backlog that slow
+    with pytest.raises(Rejected) as rejected:
+        queue.enter()
+    assert rejected.value.reason == "latency"
+    # Retry once the backlog has drained: 2 s for the one request ahead
+    assert rejected.value.retry_after == 2
+    queue.leave(token)
+
+
+def test_no_limit_admits_everything():
+    queue = AdmissionQueue(max_active=0)
+    for _ in range(100):
+        queue.enter()
+    assert queue.stats()["active"] == 0
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    queue = AdmissionQueue(max_active=1, max_queue=0, retry_after=3)
+    monkeypatch.setattr(app, "admission", queue)
+    return queue
+
+
+def test_shed_request_gets_retry_after(admission):
+    token = admission.enter()
+    response = app.app.test_client().post('/api/ask', json={'question': 'How do I file a small claims case?'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert response.json["reason"] == "queue_full"
+    admission.leave(token)
+
+
+def test_other_endpoints_are_not_admitted(admission):
+    token = admission.enter()
+    assert app.app.test_client().get('/api/suggest?q=how').status_code == 200
+    admission.leave(token)
+
+
+def test_slot_released_after_request(admission):
+    response = app.app.test_client().post('/api/ask', json={'question': 'How do I file a small claims case?'})
+    assert response.status_code == 200
+    assert admission.stats()["active"] == 0
+
+
+@pytest.mark.parametrize("path, kwargs", [
+    ('/api/ask/stream', {"json": {"question": "How do I file a small claims case?"}}),
+    ('/api/ask/batch', {"data": '{"question": "How do I file a small claims case?"}\n',
+                        "content_type": "application/x-ndjson"}),
+])
+def test_slot_held_until_stream_finishes(admission, path, kwargs):
+    response = app.app.test_client().post(path, buffered=False, **kwargs)
+    assert response.status_code == 200
+    # The body is produced after the view returns; it still holds the slot
+    assert admission.stats()["active"] == 1
+    body = b"".join(response.response)
+    assert body
+    response.close()
+    assert admission.stats()["active"] == 0
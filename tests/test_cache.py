@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+from cache import QueryCache, SingleFlight
+from knowledge_base import KnowledgeBase
+
+SECTIONS = {
+    "filing": {"title": "Filing a Claim", "content": "File your claim with the clerk of the small claims court."},
+    "deposits": {"title": "Security Deposits", "content": "A landlord must return the tenant's security deposit."},
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    cache = QueryCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = QueryCache(maxsize=4, ttl=10, clock=clock)
+    cache.put("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_counters():
+    cache = QueryCache(maxsize=1)
+    cache.get("a")
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.put("b", 2)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+    assert stats["hit_rate"] == 2 / 3
+
+
+def test_zero_maxsize_disables_caching():
+    cache = QueryCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_publish_invalidates_cached_results():
+    kb = KnowledgeBase(sections=SECTIONS, cache=QueryCache())
+    kb.search("security deposit")
+    version = kb.version
+    kb.publish()
+    assert kb.version == version + 1
+    assert kb.cache.stats()["size"] == 0
+    kb.search("security deposit")
+    assert kb.cache.stats()["hits"] == 0
+    assert kb.cache.stats()["misses"] == 2
+
+
+def test_case_and_punctuation_share_an_entry():
+    kb = KnowledgeBase(sections=SECTIONS, cache=QueryCache())
+    first = kb.search("How do I file a claim?")
+    second = kb.search("how do i FILE a claim")
+    assert first == second
+    stats = kb.cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def run_coalesced(fn):
+    # Starts a leader running fn and a follower for the same key, lets the
+    # leader finish once the follower is waiting, and returns what each got
+    flights = SingleFlight()
+    release = threading.Event()
+    outcomes = {}
+    
+    def leader():
+        release.wait()
+        return fn()
+    
+    def call(name, function):
+        try:
+            outcomes[name] = ("value", flights.do("key", function))
+        except Exception as e:
+            outcomes[name] = ("error", e)
+    
+    threads = [threading.Thread(target=call, args=("leader", leader))]
+    threads[0].start()
+    wait_until(lambda: flights.stats()["in_flight"] == 1)
+    threads.append(threading.Thread(target=call, args=("follower", lambda: pytest.fail("follower ran"))))
+    threads[1].start()
+    wait_until(lambda: flights.stats()["coalesced"] == 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert flights.stats() == {"in_flight": 0, "coalesced": 1}
+    return outcomes
+
+
+def test_single_flight_shares_the_leaders_value():
+    calls = []
+    
+    def search():
+        calls.append(1)
+        return ["result"]
+    outcomes = run_coalesced(search)
+    assert outcomes["leader"] == outcomes["follower"] == ("value", ["result"])
+    assert calls == [1]
+
+
+def test_single_flight_shares_the_leaders_exception():
+    error = ValueError("scoring failed")
+    
+    def fail():
+        raise error
+    outcomes = run_coalesced(fail)
+    assert outcomes["leader"] == outcomes["follower"] == ("error", error)
+
+
+def test_single_flight_runs_again_after_the_call_finishes():
+    flights = SingleFlight()
+    assert flights.do("key", lambda: 1) == 1
+    assert flights.do("key", lambda: 2) == 2
+    assert flights.stats()["coalesced"] == 0
@@ -0,0 +1,74 @@
+# An index file must answer exactly like the index built in memory from the
+# same data
+import struct
+
+import pytest
+
+from cache import QueryCache
+from index_file import FORMAT_VERSION, IndexFileError, load_index_file, main, misspellings, sample_queries
+from knowledge_base import DATA_DIR, KnowledgeBase
+
+
+def build(tmp_path, scoring, semantic_dims=0):
+    path = str(tmp_path / f"{scoring}-{semantic_dims}.bin")
+    assert main(["build", "--data-dir", DATA_DIR, "--scoring", scoring,
+                 "--semantic-dims", str(semantic_dims), "-o", path]) == 0
+    return path
+
+
+@pytest.mark.parametrize("scoring", ["overlap", "bm25"])
+@pytest.mark.parametrize("semantic_dims", [0, 8])
+def test_round_trip(tmp_path, scoring, semantic_dims):
+    path = build(tmp_path, scoring, semantic_dims)
+    weight = 0.5 if semantic_dims else 0.0
+    fresh = KnowledgeBase(data_dir=DATA_DIR, scoring=scoring, cache=QueryCache(maxsize=0),
+                          semantic=weight, semantic_dims=semantic_dims or 64)
+    mapped = KnowledgeBase(index_file=path, cache=QueryCache(maxsize=0), semantic=weight)
+    assert mapped.scoring == scoring
+    assert (mapped.snapshot.semantic is not None) == bool(semantic_dims)
+    
+    # Stored vectors are float32, so dense scores only agree to about 1e-7
+    tolerance = 1e-6 if semantic_dims else 1e-9
+    for query in sample_queries(fresh.snapshot) + ["security deposit", "small claims limit"]:
+        expected, found = fresh.search(query), mapped.search(query)
+        assert [{**r, "score": 0} for r in found] == [{**r, "score": 0} for r in expected], query
+        assert [r["score"] for r in found] == pytest.approx([r["score"] for r in expected], abs=tolerance), query
+    for word in misspellings(fresh.snapshot):
+        assert mapped.speller.closest(word) == fresh.speller.closest(word), word
+
+
+def test_corrupted_file(tmp_path):
+    path = build(tmp_path, "overlap")
+    with open(path, "r+b") as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xFF]))
+    with pytest.raises(IndexFileError, match="checksum"):
+        load_index_file(path, check=True)
+
+
+def test_truncated_file(tmp_path):
+    path = build(tmp_path, "overlap")
+    with open(path, "r+b") as f:
+        f.truncate(16)
+    with pytest.raises(IndexFileError, match="too short"):
+        load_index_file(path)
+
+
+def test_wrong_version(tmp_path):
+    path = build(tmp_path, "overlap")
+    with open(path, "r+b") as f:
+        f.seek(8)
+        f.write(struct.pack("<I", FORMAT_VERSION + 1))
+    with pytest.raises(IndexFileError, match="version"):
+        load_index_file(path)
+    with pytest.raises(IndexFileError):
+        KnowledgeBase(index_file=path)
+
+
+def test_not_an_index_file(tmp_path):
+    path = tmp_path / "index.bin"
+    path.write_bytes(b"\0" * 4096)
+    with pytest.raises(IndexFileError, match="not a SmallClaims index file"):
+        load_index_file(str(path))
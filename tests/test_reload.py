@@ -0,0 +1,106 @@
+# reload() re-reads only the files that changed since the last load
+import json
+import os
+
+from cache import QueryCache
+from knowledge_base import KnowledgeBase, parse_markdown
+
+DEPOSITS = """---
+key: deposits
+citation: General Obligations Law 7-108
+---
+# Security Deposits
+A landlord must return the security deposit within fourteen days.
+## Itemized Statement
+The landlord must list any deductions from the deposit.
+"""
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    # Make the change visible even where mtimes are coarse
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def write_json(path, title, content):
+    write(path, json.dumps({"key": "filing", "citation": "CCA 1803", "title": title, "content": content}))
+
+
+def titles(kb):
+    return sorted(document["section"] for document in kb.documents)
+
+
+def test_parse_markdown_front_matter():
+    [section] = parse_markdown(DEPOSITS, "default")
+    assert section["key"] == "deposits"
+    assert section["citation"] == "General Obligations Law 7-108"
+    assert section["title"] == "Security Deposits"
+    assert section["content"] == "A landlord must return the security deposit within fourteen days."
+    assert section["subsections"] == {"itemized_statement": {
+        "title": "Itemized Statement", "content": "The landlord must list any deductions from the deposit."}}
+
+
+def test_parse_markdown_without_front_matter():
+    [section] = parse_markdown("# Appeals\nFile a notice of appeal.", "appeals")
+    assert (section["key"], section["citation"], section["title"]) == ("appeals", None, "Appeals")
+
+
+def test_reload_reads_only_changed_files(tmp_path, monkeypatch):
+    write_json(tmp_path / "filing.json", "Filing a Claim", "File your claim with the clerk.")
+    write(tmp_path / "deposits.md", DEPOSITS)
+    kb = KnowledgeBase(data_dir=str(tmp_path), cache=QueryCache(maxsize=0))
+    assert titles(kb) == ["Filing a Claim", "Security Deposits", "Security Deposits - Itemized Statement"]
+    assert kb.citations["deposits"] == "General Obligations Law 7-108"
+    
+    analyzed = []
+    analyze_file = kb.analyze_file
+    
+    def counting(path, mtime):
+        analyzed.append(os.path.basename(path))
+        return analyze_file(path, mtime)
+    monkeypatch.setattr(kb, "analyze_file", counting)
+    
+    version = kb.version
+    assert kb.reload() == []
+    assert analyzed == [] and kb.version == version
+    
+    # Changed JSON
+    write_json(tmp_path / "filing.json", "Starting a Case", "Start your case at the clerk's office.")
+    assert kb.reload() == ["filing.json"]
+    assert analyzed == ["filing.json"]
+    assert kb.version == version + 1
+    assert "Starting a Case" in titles(kb)
+    
+    # Changed Markdown
+    analyzed.clear()
+    write(tmp_path / "deposits.md", DEPOSITS.replace("fourteen", "thirty"))
+    assert kb.reload() == ["deposits.md"]
+    assert analyzed == ["deposits.md"]
+    assert "thirty" in kb.sections["deposits"]["content"]
+    
+    # Added Markdown without front matter
+    analyzed.clear()
+    write(tmp_path / "appeals.md", "# Appeals\nFile a notice of appeal within thirty days.")
+    assert kb.reload() == ["appeals.md"]
+    assert analyzed == ["appeals.md"]
+    assert "Appeals" in titles(kb)
+    
+    # Deleted JSON
+    analyzed.clear()
+    os.remove(tmp_path / "filing.json")
+    assert kb.reload() == ["filing.json"]
+    assert analyzed == []
+    assert titles(kb) == ["Appeals", "Security Deposits", "Security Deposits - Itemized Statement"]
+    assert kb.search("landlord deposit")[0]["citation"] == "General Obligations Law 7-108"
+
+
+def test_unchanged_sources_are_not_retokenized(tmp_path):
+    write_json(tmp_path / "filing.json", "Filing a Claim", "File your claim with the clerk.")
+    write(tmp_path / "deposits.md", DEPOSITS)
+    kb = KnowledgeBase(data_dir=str(tmp_path), cache=QueryCache(maxsize=0))
+    deposits = kb.sources["deposits.md"]
+    write_json(tmp_path / "filing.json", "Filing a Claim", "File your claim with the court clerk.")
+    kb.reload()
+    assert kb.sources["deposits.md"] is deposits
@@ -0,0 +1,51 @@
+# ScoringEngine.top_k prunes with MaxScore; it must return exactly what
+# scoring every document, thresholding and sorting returns.
+import random
+
+import numpy as np
+import pytest
+
+from scoring import ScoringEngine
+
+
+def random_corpus(seed, num_docs=400, num_terms=300):
+    # Zipf-ish term frequencies, so some terms are common and most are rare
+    rng = random.Random(seed)
+    index = {}
+    for doc_id in range(num_docs):
+        for _ in range(rng.randint(1, 40)):
+            term = f"t{int(rng.paretovariate(1.0)) % num_terms}"
+            postings = index.setdefault(term, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+    # Sections and subsections use different relevance thresholds
+    thresholds = np.array([rng.choice([0.2, 0.3]) for _ in range(num_docs)])
+    queries = [[f"t{int(rng.paretovariate(0.8)) % (num_terms + 20)}" for _ in range(rng.randint(1, 6))]
+               for _ in range(200)]
+    return index, num_docs, thresholds, queries
+
+
+def exhaustive(engine, tokens, k, thresholds):
+    doc_ids, scores = engine.score(tokens)
+    passing = scores > thresholds[doc_ids]
+    ranked = sorted(zip((-scores[passing]).tolist(), doc_ids[passing].tolist()))[:k]
+    return [doc_id for _, doc_id in ranked], [-score for score, _ in ranked]
+
+
+@pytest.mark.parametrize("mode", ["tfidf", "bm25"])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_top_k_matches_exhaustive(mode, seed):
+    index, num_docs, thresholds, queries = random_corpus(seed)
+    engine = ScoringEngine(index, num_docs, mode=mode)
+    for tokens in queries:
+        for k in (1, 3, 10, 50):
+            expected_ids, expected_scores = exhaustive(engine, tokens, k, thresholds)
+            doc_ids, scores = engine.top_k(tokens, k, thresholds)
+            assert doc_ids.tolist() == expected_ids, (tokens, k)
+            assert scores.tolist() == expected_scores, (tokens, k)
+
+
+def test_top_k_without_known_terms():
+    index, num_docs, thresholds, _ = random_corpus(0)
+    engine = ScoringEngine(index, num_docs, mode="bm25")
+    doc_ids, scores = engine.top_k(["missing"], 3, thresholds)
+    assert len(doc_ids) == 0 and len(scores) == 0
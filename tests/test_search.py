@@ -0,0 +1,40 @@
+# The indexed search must give exactly what the brute-force reference,
+# search_exhaustive(), gives: same sections, same scores, same order.
+import pytest
+
+from cache import QueryCache
+from knowledge_base import KnowledgeBase
+
+# The "Common Questions" in the sidebar of templates/index.html
+COMMON_QUESTIONS = [
+    "How do I file a small claims case?",
+    "What is the monetary limit for small claims court?",
+    "How do I collect a judgment?",
+    "What should I do on the day of trial?",
+    "How long do I have to file my case?",
+]
+
+
+@pytest.fixture(scope="module")
+def kb():
+    return KnowledgeBase(cache=QueryCache(maxsize=0))
+
+
+def questions(kb):
+    # Clicking a topic in the sidebar asks its title
+    return kb.get_section_titles() + COMMON_QUESTIONS
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_search_matches_exhaustive(kb, k):
+    for question in questions(kb):
+        expected = kb.search_exhaustive(question, k)
+        found = kb.search(question, k)
+        assert [(r["section"], r["citation"]) for r in found] == \
+            [(r["section"], r["citation"]) for r in expected], question
+        assert [r["score"] for r in found] == pytest.approx([r["score"] for r in expected]), question
+
+
+def test_batch_matches_single(kb):
+    batch = questions(kb)
+    assert kb.search_batch(batch) == [kb.search(question) for question in batch]
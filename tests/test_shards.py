@@ -0,0 +1,113 @@
+from collections import Counter
+import json
+
+import pytest
+
+import app
+import metrics
+from shards import ShardedKnowledgeBase, UnknownJurisdiction
+
+DEPOSIT = "A landlord must return the security deposit to the tenant within fourteen days."
+FILING = "File your claim with the clerk of the small claims court in the county where the defendant lives."
+
+
+def write_section(directory, key, title, content, citation):
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / f"{key}.json", "w", encoding="utf-8") as f:
+        json.dump({"key": key, "title": title, "content": content, "citation": citation}, f)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # ny (the default, at the top) and nj hold the same deposit passage
+    write_section(tmp_path, "deposits", "Security Deposits", DEPOSIT, "NY GOL 7-108")
+    write_section(tmp_path, "filing", "Filing a Claim", FILING, "NY UCCA 1803")
+    write_section(tmp_path / "nj", "deposits", "Security Deposits", DEPOSIT, "NJ 46:8-21.1")
+    for name in ("ct", "pa"):
+        write_section(tmp_path / name, "filing", "Filing a Claim", FILING, f"{name.upper()} Filing")
+    return str(tmp_path)
+
+
+def test_jurisdictions(data_dir):
+    shards = ShardedKnowledgeBase(data_dir=data_dir)
+    assert shards.jurisdictions() == ["ct", "nj", "ny", "pa"]
+    assert shards.loaded() == []
+
+
+def test_ties_go_to_the_jurisdiction_named_first(data_dir):
+    shards = ShardedKnowledgeBase(data_dir=data_dir)
+    first = shards.search("security deposit", k=2, jurisdictions=["ny", "nj"])
+    assert [(r["jurisdiction"], r["citation"]) for r in first] == [("ny", "NY GOL 7-108"), ("nj", "NJ 46:8-21.1")]
+    assert first[0]["score"] == first[1]["score"]
+    swapped = shards.search("security deposit", k=1, jurisdictions=["nj", "ny"])
+    assert [r["jurisdiction"] for r in swapped] == ["nj"]
+
+
+def test_merge_keeps_rank_order_within_a_shard():
+    found = [[{"id": "a0", "score": 1.0}, {"id": "a1", "score": 0.5}],
+             [{"id": "b0", "score": 1.0}, {"id": "b1", "score": 0.7}]]
+    assert [r["id"] for r in ShardedKnowledgeBase.merge(found, 3)] == ["a0", "b0", "b1"]
+
+
+@pytest.mark.parametrize("name", ["tx", "../etc", "..", "nj/..", "NJ", ""])
+def test_unknown_jurisdiction(data_dir, name):
+    shards = ShardedKnowledgeBase(data_dir=data_dir)
+    with pytest.raises(UnknownJurisdiction):
+        shards.shard(name)
+    with pytest.raises(UnknownJurisdiction):
+        shards.route(["ny", name])
+    assert name not in shards.loaded()
+
+
+def test_max_loaded_unloads_least_recently_used(data_dir):
+    shards = ShardedKnowledgeBase(data_dir=data_dir, max_loaded=3)
+    for name in ("ny", "nj", "ct"):
+        shards.shard(name)
+    # ny is now the least recently used, but the default stays loaded
+    shards.shard("nj")
+    shards.shard("pa")
+    assert shards.loaded() == ["ny", "nj", "pa"]
+    shards.shard("ct")
+    assert shards.loaded() == ["ny", "pa", "ct"]
+
+
+def test_max_loaded_never_unloads_the_default(data_dir):
+    shards = ShardedKnowledgeBase(data_dir=data_dir, max_loaded=1)
+    shards.shard("ny")
+    shards.shard("nj")
+    assert shards.loaded() == ["ny", "nj"]
+    shards.shard("ct")
+    assert shards.loaded() == ["ny", "ct"]
+
+
+def test_search_many_matches_search_corrected(data_dir):
+    shards = ShardedKnowledgeBase(data_dir=data_dir)
+    questions = ["security deposit", "file a claim with the clerk", "security deposit", "landlrd deposit"]
+    results, corrections = shards.search_many(questions, k=3, jurisdictions=["ny", "nj"])
+    expected = [shards.search_corrected(question, 3, ["ny", "nj"]) for question in questions]
+    assert results == [found for found, _ in expected]
+    assert corrections == [fixes for _, fixes in expected]
+    assert corrections[3] == {"landlrd": "landlord"}
+
+
+def test_pool_stages_reach_the_request_timings(data_dir, monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    shards = ShardedKnowledgeBase(data_dir=data_dir)
+    metrics.begin_request(True)
+    shards.search_corrected("security deposit", 3, ["ny", "nj"])
+    timings = metrics.end_request()
+    stages = Counter(name for name, _ in timings)
+    # Both shards ran on the pool
+    assert all(stages[name] == 2 for name in ("correct", "cache", "score", "rank")), stages
+
+
+def test_server_timing_covers_every_shard(data_dir, monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(app, "shards", ShardedKnowledgeBase(data_dir=data_dir))
+    monkeypatch.setattr(app, "kb", None)
+    monkeypatch.setattr(app, "suggester", None)
+    response = app.app.test_client().post('/api/ask', json={"question": "security deposit", "jurisdiction": "ny,nj"},
+                                          headers={"X-Timing": "1"})
+    assert response.status_code == 200
+    stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+    assert {"correct", "cache", "score", "rank", "answer", "serialize"} <= set(stages)
@@ -0,0 +1,71 @@
+import pytest
+
+import app
+from cache import QueryCache
+from knowledge_base import KnowledgeBase
+from spelling import SymSpell
+
+TERMS = [("eviction", 5), ("evidence", 9), ("state", 12), ("contract", 7)]
+
+
+def test_corrects_misspellings():
+    speller = SymSpell(TERMS)
+    assert speller.correct("evicton") == "eviction"
+    assert speller.correct("evidense") == "evidence"
+    assert speller.correct("eviction") is None
+
+
+def test_leaves_real_words_alone():
+    real = {"statute", "contractor"}
+    speller = SymSpell(TERMS, known=real.__contains__)
+    assert speller.correct("statute") is None
+    assert speller.correct("contractor") is None
+    assert speller.correct("evicton") == "eviction"
+
+
+def test_update_matches_a_fresh_build():
+    speller = SymSpell(TERMS)
+    assert speller.correct("evicton") == "eviction"
+    terms = [("evidence", 9), ("state", 12), ("contract", 7), ("evictions", 3)]
+    speller.update(terms)
+    fresh = SymSpell(terms)
+    assert speller.counts == fresh.counts
+    assert {key: sorted(value) for key, value in speller.deletes.items()} == \
+        {key: sorted(value) for key, value in fresh.deletes.items()}
+    # The memoized correction to a term that is gone is not served again
+    assert speller.correct("evicton") == "evictions"
+
+
+@pytest.fixture(scope="module")
+def kb():
+    return KnowledgeBase(cache=QueryCache(maxsize=0))
+
+
+# Regressions: corpus terms within two edits of a real word used to
+# replace it ("statute" became "state", "contractor" became "contract")
+@pytest.mark.parametrize("question", ["statute of limitations", "What is the statute for fraud",
+                                      "My contractor never finished the job"])
+def test_real_words_are_not_corrected(kb, question):
+    results, corrections = kb.search_corrected(question)
+    assert corrections == {}
+    assert not any(result["section"].startswith("Auto Law") for result in results)
+
+
+def test_misspelled_query_is_corrected(kb):
+    results, corrections = kb.search_corrected("evicton notice")
+    assert corrections == {"evicton": "eviction"}
+    assert results
+
+
+def test_batch_reports_corrections(kb):
+    questions = ["evicton notice", "statute of limitations", "evicton notice"]
+    results, corrections = kb.search_many(questions)
+    assert corrections == [{"evicton": "eviction"}, {}, {"evicton": "eviction"}]
+    assert results == [kb.search_corrected(question)[0] for question in questions]
+
+
+def test_batch_endpoint_reports_corrections():
+    response = app.app.test_client().post('/api/ask/batch', json={"questions": ["evicton notice", "statute of limitations"]})
+    answers = response.json["results"]
+    assert answers[0]["corrections"] == [{"original": "evicton", "corrected": "eviction"}]
+    assert answers[1]["corrections"] == []
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import suggest
+from cache import QueryCache
+from knowledge_base import KnowledgeBase
+from suggest import Suggester
+
+SECTIONS = {
+    "filing": {"title": "Filing a Claim", "content": "File your claim with the clerk of the small claims court."},
+}
+
+
+def test_trim_keeps_the_more_frequent_half():
+    suggester = Suggester(kb=None, max_questions=4)
+    for question in ["Question a", "Question b", "Question c", "Question d"]:
+        suggester.record(question)
+    suggester.record("Question c")
+    suggester.record("Question e")
+    # Full at four: "c" (asked twice) and the smaller of the tied keys stay
+    assert suggester.questions == {
+        "question c": ["Question c", 2],
+        "question a": ["Question a", 1],
+        "question e": ["Question e", 1],
+    }
+
+
+def test_trim_with_every_count_equal():
+    suggester = Suggester(kb=None, max_questions=4)
+    for question in ["d", "c", "b", "a", "e"]:
+        suggester.record(question)
+    assert sorted(suggester.questions) == ["a", "b", "e"]
+
+
+def texts(suggester, text):
+    return [suggestion["text"] for suggestion in suggester.suggest(text)]
+
+
+def test_logged_questions_need_min_count():
+    kb = KnowledgeBase(sections=SECTIONS, cache=QueryCache(maxsize=0))
+    suggester = Suggester(kb, min_count=3, rebuild_interval=0)
+    question = "How do I file a claim <img src=x onerror=alert(1)>"
+    for _ in range(2):
+        suggester.record(question)
+    suggester.refresh()
+    assert question not in texts(suggester, "how do i f")
+    suggester.record(question)
+    suggester.refresh()
+    assert question in texts(suggester, "how do i f")
+
+
+def test_titles_need_no_min_count():
+    kb = KnowledgeBase(sections=SECTIONS, cache=QueryCache(maxsize=0))
+    suggester = Suggester(kb, min_count=3, rebuild_interval=0)
+    assert suggester.suggest("fil")[0] == {"text": "Filing a Claim", "kind": "title"}
+    suggester.record("filing a claim")
+    suggester.refresh()
+    assert suggester.suggest("fil")[0] == {"text": "Filing a Claim", "kind": "title"}
+
+
+def test_suggest_rebuilds_in_the_background(monkeypatch):
+    kb = KnowledgeBase(sections=SECTIONS, cache=QueryCache(maxsize=0))
+    suggester = Suggester(kb, min_count=1, rebuild_interval=0)
+    suggester.refresh()
+    
+    # Hold the rebuild inside PrefixIndex, where the old code held the lock
+    building = threading.Event()
+    finish = threading.Event()
+    
+    class SlowIndex(suggest.PrefixIndex):
+        def __init__(self, entries):
+            building.set()
+            assert finish.wait(5)
+            super().__init__(entries)
+    monkeypatch.setattr(suggest, "PrefixIndex", SlowIndex)
+    
+    suggester.record("How do I file a claim online")
+    # Served from the old index while the new one is built
+    assert "How do I file a claim online" not in texts(suggester, "how do i f")
+    assert building.wait(5)
+    assert suggester.refreshing
+    # Neither suggest() nor record() waits for the rebuild
+    suggester.record("How do I file a claim by mail")
+    assert "How do I file a claim online" not in texts(suggester, "how do i f")
+    
+    finish.set()
+    deadline = time.monotonic() + 5
+    while suggester.refreshing:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    assert "How do I file a claim online" in texts(suggester, "how do i f")
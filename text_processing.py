@@ -0,0 +1,170 @@
+import nltk
+from nltk.corpus import wordnet
+from nltk.tokenize import word_tokenize
+import os
+import re
+import string
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# NLTK resources the pipeline needs, by download name and data path
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet'
+}
+
+# Extra directories to look for bundled NLTK data (os.pathsep separated).
+# Downloading is off unless SMALLCLAIMS_NLTK_DOWNLOAD=1 so air-gapped hosts
+# fail fast with a clear message instead of hanging on the network.
+NLTK_DATA_DIRS = [path for path in os.environ.get('SMALLCLAIMS_NLTK_DATA', '').split(os.pathsep) if path]
+NLTK_DOWNLOAD = os.environ.get('SMALLCLAIMS_NLTK_DOWNLOAD', '0') == '1'
+
+for path in reversed(NLTK_DATA_DIRS):
+    if path not in nltk.data.path:
+        nltk.data.path.insert(0, path)
+
+# Tokenizer used by the default normalizer: 'nltk' (word_tokenize, the
+# reference behaviour) or 'regex' (faster, close to but not exactly the same)
+TOKENIZER = os.environ.get('SMALLCLAIMS_TOKENIZER', 'nltk')
+LEMMA_CACHE_SIZE = int(os.environ.get('SMALLCLAIMS_LEMMA_CACHE_SIZE', 50000))
+
+# Approximates word_tokenize: keeps hyphenated words, numbers like 5,000 and
+# paths like registered/certified together, splits off clitics ('s, n't)
+# and single punctuation characters
+REGEX_TOKEN = re.compile(r"[^\W_]+(?:[-.,/][^\W_]+)*(?=n't)|n't|'[a-z]+|[^\W_]+(?:[-.,/][^\W_]+)*|[^\w\s]|_+")
+
+# Marks a token the normalizer hasn't seen yet
+MISSING = object()
+
+# Loaded on first use, or up front by warm_up()
+lemmatizer = None
+stop_words = None
+load_lock = threading.Lock()
+
+
+def ensure_nltk_data(download=None):
+    # Check the bundled data is present, downloading it only when allowed
+    download = NLTK_DOWNLOAD if download is None else download
+    missing = []
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            if download and nltk.download(name, download_dir=NLTK_DATA_DIRS[0] if NLTK_DATA_DIRS else None, quiet=True):
+                continue
+            missing.append(name)
+    if missing:
+        raise LookupError(
+            f"Missing NLTK data: {', '.join(missing)}. Install it under one of {nltk.data.path} "
+            "(or point SMALLCLAIMS_NLTK_DATA at it), or set SMALLCLAIMS_NLTK_DOWNLOAD=1 to download it."
+        )
+
+
+def load():
+    global lemmatizer, stop_words
+    if stop_words is not None:
+        return
+    with load_lock:
+        if stop_words is not None:
+            return
+        ensure_nltk_data()
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+        lemmatizer = WordNetLemmatizer()
+        stop_words = set(stopwords.words('english'))
+
+
+def is_word(token):
+    # Whether WordNet knows token as an English word. Spelling correction
+    # leaves such words alone even when the corpus never uses them.
+    load()
+    return bool(wordnet.synsets(token))
+
+
+def warm_up():
+    # Load every corpus now rather than on the first request
+    load()
+    preprocess_text("Warming up the claims tokenizer.")
+
+
+class TokenNormalizer:
+    # Turns text into index terms. Lemmas are memoized per surface token
+    # (None marks a stopword) so WordNet is consulted once per distinct token.
+    # Tokens seen while indexing the corpus are pinned; other entries are
+    # evicted oldest-first once there are more than maxsize of them.
+    # Lookups are plain dict reads, so only inserts take the lock.
+    def __init__(self, tokenizer="nltk", maxsize=50000):
+        if tokenizer not in ("nltk", "regex"):
+            raise ValueError(f"Unknown tokenizer: {tokenizer}")
+        self.tokenizer = tokenizer
+        self.maxsize = maxsize
+        self.lemmas = {}
+        self.evictable = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def tokenize(self, text):
+        if self.tokenizer == "regex":
+            return REGEX_TOKEN.findall(text)
+        return word_tokenize(text)
+    
+    def lemma(self, token, pin=False):
+        lemma = self.lemmas.get(token, MISSING)
+        if lemma is MISSING or (pin and token in self.evictable):
+            if lemma is MISSING:
+                lemma = lemmatizer.lemmatize(token)
+                if lemma in stop_words:
+                    lemma = None
+            self.remember(token, lemma, pin)
+        return lemma
+    
+    def remember(self, token, lemma, pin):
+        with self.lock:
+            self.lemmas[token] = lemma
+            if pin:
+                self.evictable.pop(token, None)
+                return
+            self.evictable[token] = None
+            while len(self.evictable) > self.maxsize:
+                old, _ = self.evictable.popitem(last=False)
+                self.lemmas.pop(old, None)
+    
+    def preprocess(self, text, pin=False):
+        load()
+        if pin:
+            # Corpus text; kept out of the query latency metrics
+            return self.normalize(self.tokenize(text.lower()), pin)
+        with metrics.stage("tokenize"):
+            raw_tokens = self.tokenize(text.lower())
+        with metrics.stage("lemmatize"):
+            return self.normalize(raw_tokens)
+    
+    def normalize(self, raw_tokens, pin=False):
+        # Drop punctuation, lemmatize and drop stop words in one pass
+        tokens = []
+        for token in raw_tokens:
+            if token in string.punctuation:
+                continue
+            lemma = self.lemma(token, pin)
+            if lemma is not None:
+                tokens.append(lemma)
+        return tokens
+    
+    def stats(self):
+        return {
+            "tokenizer": self.tokenizer,
+            "cached": len(self.lemmas),
+            "pinned": len(self.lemmas) - len(self.evictable),
+            "maxsize": self.maxsize
+        }
+
+
+normalizer = TokenNormalizer(tokenizer=TOKENIZER, maxsize=LEMMA_CACHE_SIZE)
+
+
+# Module-level so it can be shipped to worker processes for batch jobs.
+# pin=True keeps the tokens in the memo for good (used for the corpus).
+def preprocess_text(text, pin=False):
+    return normalizer.preprocess(text, pin)